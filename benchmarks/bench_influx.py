@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.influx import LineWriter
+
+
+SERIES = 100000
+TAGS = ["storage", "pool"]
+
+
+# Series shaped like the Storwize pool records
+def generate(count):
+    for number in range(count):
+        yield {
+            "storage": f"fs9150-{number % 50}.domain.local",
+            "pool": f"Pool{number}",
+            "capacity": 1099511627776 + number,
+            "free_capacity": 549755813888 - number,
+            "used_pc": number % 100 / 3
+        }
+
+
+def run_json(count, output):
+    result = list(generate(count))
+    print(json.dumps(result, indent=2), file=output)
+
+
+def run_influx(count, output):
+    writer = LineWriter("storwize", TAGS, output)
+    writer.write_all(generate(count))
+    writer.flush()
+
+
+# Runs one serializer in a child process so its peak RSS is its own
+def measure(mode, count):
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--run", mode, "--series", str(count)])
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status:
+        sys.exit(f"{mode} run failed")
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the JSON list output with streamed line protocol")
+    parser.add_argument("--series", type=int, default=SERIES)
+    parser.add_argument("--run", choices=["json", "influx", "baseline"])
+    args = parser.parse_args()
+
+    if args.run:
+        with open(os.devnull, "w") as output:
+            if args.run == "json":
+                run_json(args.series, output)
+            elif args.run == "influx":
+                run_influx(args.series, output)
+        return
+
+    _, baseline_rss = measure("baseline", args.series)
+    print(f"series: {args.series}, interpreter baseline RSS {baseline_rss:.1f} MiB")
+    for mode in ("json", "influx"):
+        elapsed, rss = measure(mode, args.series)
+        print(f"{mode:<8}{elapsed:>8.3f} s{rss:>10.1f} MiB peak RSS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import logging
+import tempfile
+import logging.handlers
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.logs import get_logger
+
+
+LOG_FILES = [
+    "snmptrap.log",
+    "event.log",
+    "parsed_event.log",
+    "parsed_event.log",
+    "parsed_event.log"
+]
+LOG_MAXSIZE = 10485760
+LOG_TIMEFORMAT = "%Y.%m.%d %H:%M:%S"
+TRAPS = 5000
+MESSAGE = "iso.3.6.1.4.1.2.6.190.4.3 \"# Error Code = 1627\"\n" * 8
+
+
+def legacy_logger(directory, logfile, message):
+    log_handler = logging.handlers.RotatingFileHandler(
+        f"{directory}/{logfile}",
+        maxBytes=LOG_MAXSIZE,
+        backupCount=5)
+    log_handler.terminator = ""
+    formatter = logging.Formatter(
+        "%(asctime)s.%(msecs)03d %(message)s", LOG_TIMEFORMAT)
+    log_handler.setFormatter(formatter)
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    logger.addHandler(log_handler)
+    logger.info(f"{logfile.split('.')[0].upper()}\n{message}")
+    logger.removeHandler(log_handler)
+    log_handler.close()
+
+
+def queued_logger(directory, logfile, message):
+    get_logger(
+        f"{directory}/{logfile}",
+        LOG_MAXSIZE,
+        "%(asctime)s.%(msecs)03d %(message)s",
+        LOG_TIMEFORMAT,
+        terminator="").info(f"{logfile.split('.')[0].upper()}\n{message}")
+
+
+def measure(log_function):
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        for _ in range(TRAPS):
+            for logfile in LOG_FILES:
+                log_function(directory, logfile, MESSAGE)
+        return (time.perf_counter() - start) / TRAPS
+
+
+def main():
+    print(f"legacy logger: {measure(legacy_logger) * 1e6:.1f} us/trap")
+    print(f"queued logger: {measure(queued_logger) * 1e6:.1f} us/trap "
+          "(caller side, writes happen in the background thread)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "snmptrap_monitoring"))
+
+from oids import OidIndex
+
+
+FIELDS = ["System Name", "Error ID", "Error Code", "Object Type", "Object ID"]
+ROUNDS = 2000
+
+
+def make_sources(systems):
+    sources = {"Storage": []}
+    for number in range(systems):
+        sources["Storage"].append({
+            comment: f"2.6.{number}.4.{position}"
+            for position, comment in enumerate(FIELDS, 1)})
+    return sources
+
+
+def make_event(system):
+    event = "UDP: [10.1.1.5]:161->[10.1.1.1]:162\n"
+    for position, comment in enumerate(FIELDS, 1):
+        event += f"oid: 3.6.1.4.1.2.6.{system}.4.{position} value: {comment}\n"
+    return event
+
+
+def legacy_parse(sources, event):
+    result = {}
+
+    def _find(value, pattern=" value: (.+)"):
+        if re.findall(f"{value}{pattern}", event):
+            return re.findall(f"{value}{pattern}", event)[0]
+
+    for source_name, source in sources.items():
+        for system in source:
+            for comment, oid in system.items():
+                if _find(oid):
+                    result.update({comment: _find(oid)})
+    return result
+
+
+def index_parse(index, event):
+    result = {}
+    for line in event.splitlines():
+        if line.startswith("oid: "):
+            oid, _, value = line[5:].partition(" value: ")
+            for _, _, _, comment in index.lookup(oid):
+                result[comment] = value
+    return result
+
+
+def main():
+    print(f"{'systems':>8} {'legacy us/trap':>15} {'index us/trap':>14}")
+    for systems in (3, 10, 30, 100, 300, 1000):
+        sources = make_sources(systems)
+        index = OidIndex(sources)
+        event = make_event(systems - 1)
+        assert legacy_parse(sources, event) == index_parse(index, event)
+
+        legacy = timeit.timeit(
+            lambda: legacy_parse(sources, event), number=ROUNDS // 10) * 10
+        indexed = timeit.timeit(
+            lambda: index_parse(index, event), number=ROUNDS)
+        print(f"{systems:>8} {legacy / ROUNDS * 1e6:>15.1f} "
+              f"{indexed / ROUNDS * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "snmptrap_monitoring"))
+
+from receiver import TrapProtocol, decode_trap
+import main as handler
+from replay import use_stand_ins
+
+
+def _encode(tag, payload):
+    length = len(payload)
+    if length < 0x80:
+        return bytes([tag, length]) + payload
+    size = (length.bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + length.to_bytes(size, "big") + payload
+
+
+def _integer(value, tag=0x02):
+    size = max(1, (value.bit_length() + 8) // 8)
+    return _encode(tag, value.to_bytes(size, "big", signed=True))
+
+
+def _oid(oid):
+    components = [int(c) for c in oid.split(".")]
+    payload = bytearray([components[0] * 40 + components[1]])
+    for component in components[2:]:
+        chunk = [component & 0x7F]
+        component >>= 7
+        while component:
+            chunk.append(0x80 | (component & 0x7F))
+            component >>= 7
+        payload.extend(reversed(chunk))
+    return _encode(0x06, bytes(payload))
+
+
+def encode_v2c_trap(community, request_id, varbinds):
+    encoded_varbinds = b""
+    for oid, value in varbinds:
+        if isinstance(value, int):
+            encoded_value = _integer(value, 0x43)
+        elif value.startswith("1.3.6."):
+            encoded_value = _oid(value)
+        else:
+            encoded_value = _encode(0x04, value.encode())
+        encoded_varbinds += _encode(0x30, _oid(oid) + encoded_value)
+    pdu = _encode(
+        0xA7,
+        _integer(request_id) + _integer(0) + _integer(0)
+        + _encode(0x30, encoded_varbinds))
+    return _encode(
+        0x30, _integer(1) + _encode(0x04, community.encode()) + pdu)
+
+
+def fs5100_trap(number):
+    prefix = "1.3.6.1.4.1.2.6.190.4"
+    return encode_v2c_trap("public", number, [
+        ("1.3.6.1.2.1.1.3.0", 123456 + number),
+        ("1.3.6.1.6.3.1.1.4.1.0", "1.3.6.1.4.1.2.6.190.3"),
+        (f"{prefix}.1", "# Machine Type = 4662F12"),
+        (f"{prefix}.3", "# Error ID = 1627"),
+        (f"{prefix}.4", "# Error Code = 1627"),
+        (f"{prefix}.7", "# Cluster Name = fs5100-1"),
+        (f"{prefix}.9", f"# Error Sequence Number = {number}"),
+        (f"{prefix}.11", "# Object Type = node"),
+        (f"{prefix}.12", f"# Object ID = {number % 40}"),
+        (f"{prefix}.17", f"# Object Name = node{number % 40}"),
+        (f"{prefix}.18", "# Message = The system has insufficient redundancy")
+    ])
+
+
+def send(port, packets, repeat, rate):
+    start = time.perf_counter()
+    sent = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _ in range(repeat):
+            for packet in packets:
+                sock.sendto(packet, ("127.0.0.1", port))
+                sent += 1
+                if rate and not sent % 100:
+                    delay = start + sent / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--traps", type=int, default=200000)
+    parser.add_argument("--port", type=int, default=16200)
+    parser.add_argument(
+        "--rate", type=int, default=0,
+        help="traps/sec to send, 0 sends as fast as possible")
+    parser.add_argument(
+        "--no-dns", action="store_true",
+        help="use the trap source address instead of resolving it")
+    args = parser.parse_args()
+
+    packets = [fs5100_trap(number) for number in range(1000)]
+    repeat = args.traps // len(packets)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for packet in packets:
+            decode_trap(packet)
+    elapsed = time.perf_counter() - start
+    print(f"decode only: {repeat * len(packets) / elapsed:.0f} traps/sec "
+          f"({len(packets[0])} byte packets)")
+
+    # The whole pipeline of a received trap: decode, then handle_pdu with
+    # logging, exception check, parsing and dispatch to stand-in sinks
+    use_stand_ins(no_dns=args.no_dns)
+    address = ("127.0.0.1", 161)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for packet in packets:
+            handler.handle_pdu(address, decode_trap(packet)[1])
+    elapsed = time.perf_counter() - start
+    handler.ELASTIC.flush()
+    handler.ZABBIX.flush()
+    print(f"decode + handle_pdu: {repeat * len(packets) / elapsed:.0f} "
+          f"traps/sec ({elapsed / (repeat * len(packets)) * 1e6:.1f} us/trap, "
+          f"{handler.ELASTIC.documents} elastic documents, "
+          f"{handler.ZABBIX.processed} zabbix items)")
+
+    received = []
+    loop = asyncio.new_event_loop()
+    transport, protocol = loop.run_until_complete(
+        loop.create_datagram_endpoint(
+            lambda: TrapProtocol(lambda address, varbinds: received.append(1)),
+            local_addr=("127.0.0.1", args.port)))
+    transport.get_extra_info("socket").setsockopt(
+        socket.SOL_SOCKET, socket.SO_RCVBUF, 16777216)
+
+    # The sender runs in its own process so it does not share a core and the
+    # GIL with the receiver
+    sender = multiprocessing.Process(
+        target=send, args=(args.port, packets, repeat, args.rate))
+    start = time.perf_counter()
+    last = None
+
+    async def wait_for_traps():
+        nonlocal last
+        while sender.is_alive() or last != protocol.received:
+            last = protocol.received
+            await asyncio.sleep(0.2)
+
+    sender.start()
+    loop.run_until_complete(wait_for_traps())
+    elapsed = time.perf_counter() - start - 0.2
+    sender.join()
+    transport.close()
+    loop.close()
+    sent = repeat * len(packets)
+    print(f"udp receive + decode: {protocol.received} of {sent} traps "
+          f"in {elapsed:.2f}s ({protocol.received / elapsed:.0f} traps/sec, "
+          f"{protocol.invalid} invalid)")
+
+
+if __name__ == "__main__":
+    main()
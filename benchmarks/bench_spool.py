@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "snmptrap_monitoring"))
+
+from spool import Spool, Replayer
+
+
+DESTINATIONS = [
+    "elastic:http://es1-monitoring1.domain.local:9200",
+    "elastic:http://es2-monitoring1.domain.local:9200",
+    "zabbix:zabbix.domain.local"
+]
+BATCH_SIZE = 500
+EVENT = {
+    "Storage": "fs5100-1.domain.local",
+    "System Name": "fs5100-1",
+    "Error ID": "1627",
+    "Error Code": "1627",
+    "Object Type": "node",
+    "Object ID": "1",
+    "Object name": "node1",
+    "@timestamp": "2024-01-01T00:00:00.000000+00:00",
+    "vision": "sys"
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        spool = Spool(directory, DESTINATIONS, max_size=16 * 1073741824)
+        start = time.perf_counter()
+        for number in range(0, args.events, BATCH_SIZE):
+            batch = [EVENT] * min(BATCH_SIZE, args.events - number)
+            for destination in DESTINATIONS:
+                spool.append(destination, batch)
+        elapsed = time.perf_counter() - start
+        size = sum(
+            os.path.getsize(os.path.join(directory, filename))
+            for filename in os.listdir(directory))
+        print(f"spooled {args.events} events x {len(DESTINATIONS)} "
+              f"destinations in {elapsed:.1f}s "
+              f"({args.events * len(DESTINATIONS) / elapsed:.0f} records/s, "
+              f"{size / 1048576:.0f} MiB)")
+
+        replayers = [
+            Replayer(spool, destination, lambda records: None, BATCH_SIZE)
+            for destination in DESTINATIONS]
+        start = time.perf_counter()
+        for replayer in replayers:
+            replayer.start()
+        while any(r.replayed < args.events for r in replayers):
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        for replayer in replayers:
+            replayer.stop()
+        print(f"drained {args.events} events x {len(DESTINATIONS)} "
+              f"destinations in {elapsed:.1f}s "
+              f"({args.events * len(DESTINATIONS) / elapsed:.0f} records/s), "
+              f"{len(os.listdir(directory)) - 2} segments left")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "ibm_storwize"))
+
+import telegraf_storwize
+from telegraf_storwize import Storwize, collect
+from common.influx import LineWriter
+from storwize_standin import StandIn, Array
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Poll simulated Storwize arrays served by local SSH "
+                    "stand-ins and report the cost of every cycle")
+    parser.add_argument("--arrays", type=int, default=10)
+    parser.add_argument("--pools", type=int, default=8)
+    parser.add_argument("--nodes", type=int, default=2)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.02,
+        help="seconds the stand-in takes to answer every command")
+    parser.add_argument(
+        "--cycles", type=int, default=3,
+        help="collections on the same sessions, like execd mode")
+    parser.add_argument(
+        "--nocompression", action="store_true",
+        help="poll the arrays like V7000s (concise pool list only)")
+    args = parser.parse_args()
+
+    telegraf_storwize.LOGGER.disabled = True
+    compression = "nocompression" if args.nocompression else "compression"
+    standins = [
+        StandIn(Array(
+            f"array{number}", args.pools, args.nodes, args.events),
+            args.latency)
+        for number in range(args.arrays)]
+    storages = [
+        Storwize(standin.address, "user", "password", standin.port)
+        for standin in standins]
+    for storage in storages:
+        storage.set_host_tag(telegraf_storwize.TAG_HOST)
+
+    print(f"{args.arrays} arrays, {args.pools} pools, {args.nodes} nodes, "
+          f"{args.events} open alerts, {args.latency * 1e3:.0f} ms per command")
+    print(f"{'cycle':<7}{'wall s':>9}{'connects':>10}{'round-trips':>13}"
+          f"{'KiB':>10}{'series':>9}")
+    executor = ThreadPoolExecutor(max_workers=telegraf_storwize.MAX_WORKERS)
+    with open(os.devnull, "w") as output:
+        writer = LineWriter(telegraf_storwize.MEASUREMENT, telegraf_storwize.TAGS, output)
+        for cycle in range(1, args.cycles + 1):
+            before = [
+                (s.connections, s.round_trips, s.bytes) for s in standins]
+            written = writer.written
+            start = time.perf_counter()
+            list(executor.map(
+                lambda storage: collect(storage, compression, writer),
+                storages))
+            elapsed = time.perf_counter() - start
+            connects, round_trips, size = (
+                sum(now - then for now, then in zip(column_now, column_then))
+                for column_now, column_then in zip(
+                    zip(*[(s.connections, s.round_trips, s.bytes)
+                          for s in standins]),
+                    zip(*before)))
+            print(f"{cycle:<7}{elapsed:>9.3f}{connects:>10}{round_trips:>13}"
+                  f"{size / 1024:>10.1f}{writer.written - written:>9}")
+    executor.shutdown()
+    for storage in storages:
+        storage.close()
+    for standin in standins:
+        standin.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import time
+import socket
+import threading
+
+import paramiko
+
+
+# A local SSH server answering the Storwize CLI commands used by
+# telegraf_storwize.py with synthetic output, for benchmarks and manual
+# runs without real arrays. Every exec request (one round-trip) and every
+# byte of output is counted; "; "-chained commands are answered together
+# like the real CLI does.
+class Array:
+    def __init__(self, name, pools=4, nodes=2, events=10, compression=True):
+        self.name = name
+        self.pools = pools
+        self.nodes = nodes
+        self.events = events
+        self.compression = compression
+
+    def lssystem(self, args):
+        return (
+            f"id:0000020421600000\nname:{self.name}\n"
+            "physical_capacity:109951162777600\n"
+            "total_vdisk_capacity:219902325555200\n"
+            "physical_free_capacity:54975581388800\n"
+            "total_mdisk_capacity:109951162777600\n"
+            "total_free_space:54975581388800\n"
+            "console_IP:10.0.0.1:443\n")
+
+    def lsmdiskgrp(self, args):
+        if args and args[-1] != ":":
+            pool = int(args[-1])
+            return (
+                f"id:{pool}\nname:Pool{pool}\nstatus:online\n"
+                f"capacity:{10995116277760 + pool}\n"
+                f"free_capacity:{5497558138880 - pool}\n"
+                f"physical_capacity:{10995116277760 + pool}\n"
+                f"total_vdisk_capacity:{21990232555520 + pool}\n"
+                f"physical_free_capacity:{5497558138880 - pool}\n")
+        return "id:name:status:mdisk_count:vdisk_count:capacity:free_capacity\n" + "".join(
+            f"{pool}:Pool{pool}:online:1:{pool * 10}:"
+            f"{10995116277760 + pool}:{5497558138880 - pool}\n"
+            for pool in range(self.pools))
+
+    def lssystemstats(self, args):
+        return "stat_name:stat_current:stat_peak:stat_peak_time\n" + "".join(
+            f"{stat}:{number}:{number * 2}:221017101010\n"
+            for number, stat in enumerate((
+                "cpu_pc", "mdisk_w_ms", "mdisk_r_ms", "mdisk_w_mb",
+                "mdisk_r_mb", "mdisk_w_io", "mdisk_r_io", "write_cache_pc")))
+
+    def lsnodestats(self, args):
+        return "node_id:node_name:stat_name:stat_current:stat_peak:stat_peak_time\n" + "".join(
+            f"{node}:node{node}:{stat}:{node * 10}:{node * 20}:221017101010\n"
+            for node in range(1, self.nodes + 1)
+            for stat in ("cpu_pc", "vdisk_mb", "vdisk_io", "vdisk_ms"))
+
+    lsnodecanisterstats = lsnodestats
+
+    def lsnodecanister(self, args):
+        return "id:name:status:config_node\n" + "".join(
+            f"{node}:node{node}:online:{'yes' if node == 1 else 'no'}\n"
+            for node in range(1, self.nodes + 1))
+
+    def lsdumps(self, args):
+        return "id:filename\n"
+
+    def lseventlog(self, args):
+        return (
+            "sequence_number:last_timestamp:object_type:object_id:"
+            "object_name:copy_id:status:fixed:event_id:error_code:"
+            "description\n") + "".join(
+            f"{100 + event}:221017101010:node:1:node1::alert:no:074002:"
+            f"{1600 + event % 50}:Node: event {event}\n"
+            for event in range(self.events))
+
+    def run(self, command):
+        output = []
+        for part in command.split("; "):
+            name, *args = part.split()
+            handler = getattr(self, name, None)
+            if handler is None or name == "run":
+                return "".join(output), f"CMMVC5786E unknown command {name}\n"
+            output.append(handler(args))
+        return "".join(output), ""
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, standin):
+        self.standin = standin
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(
+            target=self.standin.answer,
+            args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+# The answer runs in its own thread while paramiko still has to send the
+# reply to the exec request; closing the channel before that reply makes
+# the client fail, so every answer takes at least MIN_LATENCY
+MIN_LATENCY = 0.005
+
+
+class StandIn:
+    host_key = None
+
+    def __init__(self, array, latency=0.02, address="127.0.0.1"):
+        if StandIn.host_key is None:
+            StandIn.host_key = paramiko.RSAKey.generate(2048)
+        self.array = array
+        self.latency = latency
+        self.connections = 0
+        self.round_trips = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.socket = socket.socket()
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((address, 0))
+        self.socket.listen(16)
+        self.address, self.port = self.socket.getsockname()
+        self.transports = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=_Server(self))
+            with self.lock:
+                self.connections += 1
+                self.transports.append(transport)
+
+    def answer(self, channel, command):
+        time.sleep(max(self.latency, MIN_LATENCY))
+        output, error = self.array.run(command)
+        data = output.encode()
+        with self.lock:
+            self.round_trips += 1
+            self.bytes += len(data)
+        channel.sendall(data)
+        if error:
+            channel.sendall_stderr(error.encode())
+        channel.send_exit_status(1 if error else 0)
+        channel.close()
+
+    def close(self):
+        self.socket.close()
+        for transport in self.transports:
+            transport.close()
@@ -0,0 +1,41 @@
+import os
+import sys
+import time
+import argparse
+
+from common.logs import stop as stop_logging
+
+
+def ticks(interval):
+    next_time = time.monotonic()
+    while True:
+        yield
+        next_time += interval
+        time.sleep(max(0, next_time - time.monotonic()))
+
+
+# When telegraf execd mode collects: on each line telegraf writes to stdin
+# (signal = "STDIN") or every interval seconds
+def triggers(interval=None):
+    return sys.stdin if interval is None else ticks(interval)
+
+
+# Ends a one-shot run without waiting for collector threads that are past
+# their timeout: the interpreter joins ThreadPoolExecutor workers at exit
+def exit_now(code=0):
+    sys.stdout.flush()
+    stop_logging()
+    os._exit(code)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--execd", action="store_true",
+        help="keep running for telegraf execd and collect on every line "
+             "read from stdin")
+    parser.add_argument(
+        "--interval", type=float,
+        help="with --execd, collect every INTERVAL seconds instead of "
+             "waiting for stdin")
+    return parser.parse_args()
@@ -0,0 +1,101 @@
+import sys
+import math
+import time
+import threading
+
+
+_MEASUREMENT_ESCAPES = str.maketrans({",": "\\,", " ": "\\ ", "\n": "\\n"})
+_KEY_ESCAPES = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n"})
+_STRING_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n"})
+
+
+def _key(text):
+    if "," in text or " " in text or "=" in text or "\n" in text:
+        return text.translate(_KEY_ESCAPES)
+    return text
+
+
+def _field(value, integers):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i" if integers else f"{value}.0"
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else None
+    return f'"{str(value).translate(_STRING_ESCAPES)}"'
+
+
+# Writes series dicts as Influx line protocol as they are produced instead
+# of collecting them for one json.dumps at the end. Keys listed in tags
+# become tags, everything else a typed field; the timestamp is left to
+# telegraf. Integers are written as floats unless integers is set, which
+# keeps the field types of series that telegraf used to parse from JSON.
+# Safe to call from several collector threads.
+class LineWriter:
+    def __init__(self, measurement, tags, file=None, integers=False):
+        self.measurement = measurement.translate(_MEASUREMENT_ESCAPES)
+        self.tags = set(tags)
+        self.integers = integers
+        # key: (is a tag, escaped key)
+        self.keys = {}
+        self.file = file or sys.stdout
+        self.lock = threading.Lock()
+        self.written = 0
+
+    def format(self, series):
+        tags = []
+        fields = []
+        keys = self.keys
+        for key, value in series.items():
+            if value is None or value == "":
+                continue
+            known = keys.get(key)
+            if known is None:
+                known = keys[key] = (key in self.tags, _key(key))
+            is_tag, name = known
+            if is_tag:
+                tags.append(f"{name}={_key(str(value))}")
+            elif type(value) is int and not self.integers:
+                fields.append(f"{name}={value}.0")
+            else:
+                value = _field(value, self.integers)
+                if value is not None:
+                    fields.append(f"{name}={value}")
+        if not fields:
+            return None
+        tags.sort()
+        return f"{','.join([self.measurement, *tags])} {','.join(fields)}\n"
+
+    def write(self, series):
+        line = self.format(series)
+        if line:
+            with self.lock:
+                self.file.write(line)
+                self.written += 1
+
+    def write_all(self, series_list):
+        for series in series_list:
+            self.write(series)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+
+# A LineWriter for collectors that are only waited for until deadline
+# (time.monotonic()). Series they produce later are left out of the output
+class DeadlineWriter:
+    def __init__(self, writer, deadline):
+        self.writer = writer
+        self.deadline = deadline
+
+    def write(self, series):
+        if time.monotonic() < self.deadline:
+            self.writer.write(series)
+
+    def write_all(self, series_list):
+        for series in series_list:
+            self.write(series)
+
+    def flush(self):
+        self.writer.flush()
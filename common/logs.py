@@ -0,0 +1,64 @@
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+
+# Every log file gets one long-lived RotatingFileHandler. Callers only put
+# records on a queue; a single background thread does the file writes and
+# the rotation checks, and drains the queue when the process exits.
+_queue = queue.SimpleQueue()
+_handlers = {}
+_listener = None
+# get_logger is called from several threads of the snmptrap daemon
+_lock = threading.Lock()
+
+
+class _FileRouter(logging.Handler):
+    def handle(self, record):
+        handler = _handlers.get(record.name)
+        if handler:
+            handler.handle(record)
+
+
+# Writes out the queued records. Runs at exit, and has to be called by a
+# process that leaves with os._exit
+def stop():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    for handler in _handlers.values():
+        handler.close()
+
+
+def get_logger(
+        filename, maxsize, fmt="%(asctime)s %(message)s", timeformat=None,
+        terminator="\n", level=logging.INFO):
+    global _listener
+
+    logger = logging.getLogger(f"{__name__}:{filename}")
+    with _lock:
+        if logger.name in _handlers:
+            return logger
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            filename,
+            maxBytes=maxsize,
+            backupCount=5,
+            delay=True)
+        file_handler.terminator = terminator
+        file_handler.setFormatter(logging.Formatter(fmt, timeformat))
+        _handlers[logger.name] = file_handler
+
+        logger.addHandler(logging.handlers.QueueHandler(_queue))
+        logger.setLevel(level)
+        logger.propagate = False
+
+        if _listener is None:
+            _listener = logging.handlers.QueueListener(_queue, _FileRouter())
+            _listener.start()
+            atexit.register(stop)
+        return logger
@@ -0,0 +1,49 @@
+import time
+
+from pyzabbix import ZabbixMetric, ZabbixSender
+
+
+# The Zabbix trapper closes the connection after every response, so the
+# cheapest way to talk to it is one multi-item packet per batch
+class ZabbixSink:
+    def __init__(
+            self, zabbix_server, zabbix_port=10051,
+            batch_size=250, flush_interval=1, on_failure=None):
+        self.sender = ZabbixSender(
+            zabbix_server, zabbix_port, chunk_size=batch_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_failure = on_failure
+        self.metrics = []
+        self.flush_time = time.monotonic()
+        self.processed = 0
+        self.failed = 0
+
+    def add(self, zabbix_host, key, value):
+        self.metrics.append(
+            ZabbixMetric(zabbix_host, key, value, clock=int(time.time())))
+        if len(self.metrics) >= self.batch_size:
+            self.flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flush_time >= self.flush_interval:
+            return self.flush()
+
+    def send(self, metrics):
+        response = self.sender.send(metrics)
+        self.processed += response.processed
+        self.failed += response.failed
+        return response
+
+    def flush(self):
+        metrics, self.metrics = self.metrics, []
+        self.flush_time = time.monotonic()
+        if not metrics:
+            return None
+
+        try:
+            return self.send(metrics)
+        except Exception as e:
+            if self.on_failure is None:
+                raise
+            self.on_failure(metrics, e)
@@ -0,0 +1,65 @@
+# Parsers for the Storwize CLI output with "-delim :"
+
+
+def typed(value: str):
+    if not value or value[0] not in "-0123456789":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+# Detailed views (lssystem, lsmdiskgrp <id>) are "key:value" lines, values
+# may contain colons. Several chained views come back as one output, a new
+# record starts whenever the first key of the output shows up again. Only
+# the values of metrics are converted, names and ids stay as printed
+def parse_detailed(lines: list, metrics=()) -> list:
+    metrics = set(metrics)
+    records = []
+    first_key = None
+    for line in lines:
+        key, _, value = line.partition(":")
+        if first_key is None:
+            first_key = key
+        if key == first_key:
+            records.append({})
+        records[-1][key] = typed(value) if key in metrics else value
+    return records
+
+
+# Concise views (lsmdiskgrp, lsnodestats, lssystemstats) are a header row
+# and one row per object. The header is read once into column indexes and
+# only the requested columns are read. A row with more fields than the
+# header had a colon in its last value
+class Table:
+    def __init__(self, lines: list):
+        self.header = lines[0].split(":") if lines else []
+        self.columns = {name: pos for pos, name in enumerate(self.header)}
+        last = len(self.header) - 1
+        self.rows = [
+            line.split(":", last) if last > 0 else [line]
+            for line in lines[1:]]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    # columns are returned as printed, metrics converted to numbers
+    def records(self, columns: list, metrics=()):
+        positions = [
+            (column, self.columns[column], column in metrics)
+            for column in [*columns, *metrics] if column in self.columns]
+        for row in self.rows:
+            yield {
+                column: typed(row[pos]) if metric else row[pos]
+                for column, pos, metric in positions if pos < len(row)}
+
+    # {key column value: value column value}, e.g. stat_name: stat_current
+    def mapping(self, key: str, value: str) -> dict:
+        key_pos = self.columns[key]
+        value_pos = self.columns[value]
+        return {row[key_pos]: typed(row[value_pos]) for row in self.rows}
@@ -0,0 +1,220 @@
+from datetime import datetime
+from xml.etree.ElementTree import iterparse
+
+from cli import Table
+
+
+STATS_DIRECTORY = "/dumps/iostats"
+# stats file prefix: (XML element, series tag, cumulative counters). The
+# counters are read and write operations, blocks of 512 bytes read and
+# written, and the read and write latency sums in milliseconds
+STATS_FILES = {
+    "Nv": ("vdsk", "volume", ("ro", "wo", "rb", "wb", "rl", "wl")),
+    "Nm": ("mdsk", "mdisk", ("ro", "wo", "rb", "wb", "re", "we"))
+}
+BLOCK_SIZE = 512
+
+
+# Reads one file from the array with the source side of the scp protocol
+# over an exec channel, so the XML is parsed while it is downloaded
+class ScpFile:
+    def __init__(self, ssh_client, path, timeout):
+        self.channel = ssh_client.get_transport().open_session(timeout=timeout)
+        self.channel.settimeout(timeout)
+        self.channel.exec_command(f"scp -f {path}")
+        self.channel.sendall(b"\0")
+        header = self._readline()
+        if not header.startswith(b"C"):
+            self.channel.close()
+            raise OSError(f"scp {path}: {header[1:].decode(errors='replace')}")
+        self.remaining = int(header.split()[1])
+        self.channel.sendall(b"\0")
+
+    def _readline(self):
+        line = b""
+        while not line.endswith(b"\n"):
+            char = self.channel.recv(1)
+            if not char:
+                break
+            line += char
+        return line
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.channel.recv(size)
+        if not data:
+            raise OSError("scp: connection closed before the end of the file")
+        self.remaining -= len(data)
+        if self.remaining <= 0:
+            self.channel.recv(1)
+            self.channel.sendall(b"\0")
+        return data
+
+    def close(self):
+        self.channel.close()
+
+
+# {object id: counters} of one stats file. Elements are dropped from the
+# tree as soon as they are read, so memory follows the number of objects
+# and not the size of the XML
+def parse_stats(file, element: str, counters: tuple) -> dict:
+    result = {}
+    root = None
+    for event, item in iterparse(file, events=("start", "end")):
+        if root is None:
+            root = item
+        if event != "end" or item.tag.rpartition("}")[2] != element:
+            continue
+        result[item.get("id")] = tuple(
+            int(item.get(counter) or 0) for counter in counters)
+        root.clear()
+    return result
+
+
+# Nv_stats_<node panel>_<yymmdd>_<hhmmss>
+def stats_time(filename: str) -> float:
+    return datetime.strptime(
+        "_".join(filename.rsplit("_", 2)[-2:]), "%y%m%d_%H%M%S").timestamp()
+
+
+# Per-volume and per-mdisk rates from the array's statistics dumps. Every
+# node writes its own files, named after its panel; the rates of a pair of
+# consecutive files are computed per panel and summed per object. The last
+# parsed file of every panel is kept, so a long-running collector downloads
+# one new file per panel and prefix when the array writes one; otherwise
+# the previous file is downloaded as well
+class Iostats:
+    def __init__(self, storage, prefixes=("Nv", "Nm"), timeout=30):
+        self.storage = storage
+        self.prefixes = prefixes
+        self.timeout = timeout
+        # (prefix, panel): (filename, counters)
+        self.previous = {}
+
+    # {(prefix, panel): {filename: node holding it}} and the config node.
+    # Files already copied to the config node are read from there
+    def _list_files(self) -> tuple:
+        nodes = Table(self.storage._exec("lsnodecanister -delim :"))
+        config_node = None
+        names = []
+        for record in nodes.records(["name", "config_node", "status"]):
+            if record.get("status") != "online":
+                continue
+            names.append(str(record["name"]))
+            if record.get("config_node") == "yes":
+                config_node = names[-1]
+
+        # One lsdumps per node chained in one command, every listing starts
+        # with its own header line
+        files = {}
+        listing = self.storage._exec("; ".join(
+            f"lsdumps -prefix {STATS_DIRECTORY} -delim : {name}"
+            for name in names)) if names else []
+        node = -1
+        for line in listing:
+            if line.startswith("id:"):
+                node += 1
+                continue
+            filename = line.split(":", 1)[-1]
+            parts = filename.split("_")
+            if parts[0] not in self.prefixes or len(parts) != 5:
+                continue
+            found = files.setdefault((parts[0], parts[2]), {})
+            if filename not in found or names[node] == config_node:
+                found[filename] = names[node]
+        return files, config_node
+
+    def _read(self, filename: str, prefix: str) -> dict:
+        element, _, counters = STATS_FILES[prefix]
+        file = ScpFile(
+            self.storage.ssh_client, f"{STATS_DIRECTORY}/{filename}",
+            self.timeout)
+        try:
+            return parse_stats(file, element, counters)
+        finally:
+            file.close()
+
+    def collect(self):
+        files, config_node = self._list_files()
+
+        # Pick the newest file and the one before it for every panel, and
+        # copy the ones to be downloaded to the config node
+        pairs = {}
+        copies = []
+        for key, found in files.items():
+            filenames = sorted(found, key=stats_time)
+            cached = self.previous.get(key)
+            if len(filenames) < 2 and not cached:
+                continue
+            latest = filenames[-1]
+            if cached and cached[0] == latest:
+                continue
+            before = filenames[-2] if len(filenames) > 1 else None
+            pairs[key] = (before, latest)
+            for filename in (before, latest):
+                if (filename and found[filename] != config_node
+                        and not (cached and cached[0] == filename)):
+                    copies.append(
+                        f"cpdumps -prefix {STATS_DIRECTORY}/{filename} "
+                        f"{found[filename]}")
+        if copies:
+            self.storage._exec("; ".join(copies))
+
+        # object: [read ops/s, write ops/s, read bytes/s, write bytes/s,
+        #          read latency sum, write latency sum, read ops, write ops]
+        totals = {prefix: {} for prefix in self.prefixes}
+        for (prefix, panel), (before, latest) in pairs.items():
+            cached = self.previous.get((prefix, panel))
+            if cached and cached[0] == before:
+                previous = cached[1]
+            elif before:
+                previous = self._read(before, prefix)
+            else:
+                previous = None
+            current = self._read(latest, prefix)
+            self.previous[(prefix, panel)] = (latest, current)
+            if previous is None:
+                continue
+
+            seconds = stats_time(latest) - stats_time(before)
+            if seconds <= 0:
+                continue
+            prefix_totals = totals[prefix]
+            for object_id, counters in current.items():
+                old = previous.get(object_id)
+                if old is None:
+                    continue
+                ro, wo, rb, wb, rl, wl = (
+                    new - old for new, old in zip(counters, old))
+                # A node restart resets its counters
+                if min(ro, wo, rb, wb, rl, wl) < 0:
+                    continue
+                total = prefix_totals.setdefault(object_id, [0.0] * 8)
+                total[0] += ro / seconds
+                total[1] += wo / seconds
+                total[2] += rb * BLOCK_SIZE / seconds
+                total[3] += wb * BLOCK_SIZE / seconds
+                total[4] += rl
+                total[5] += wl
+                total[6] += ro
+                total[7] += wo
+
+        for prefix, prefix_totals in totals.items():
+            tag = STATS_FILES[prefix][1]
+            for object_id, total in prefix_totals.items():
+                series = {
+                    self.storage.host_tag: self.storage.host,
+                    tag: object_id,
+                    "read_iops": round(total[0], 3),
+                    "write_iops": round(total[1], 3),
+                    "read_bytes": round(total[2], 3),
+                    "write_bytes": round(total[3], 3)
+                }
+                if total[6]:
+                    series["read_latency_ms"] = round(total[4] / total[6], 3)
+                if total[7]:
+                    series["write_latency_ms"] = round(total[5] / total[7], 3)
+                yield series
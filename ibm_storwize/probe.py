@@ -0,0 +1,38 @@
+import time
+import socket
+import asyncio
+
+
+# Reachability of every host by TCP connects to its SSH port: count connects
+# one after another per host, all hosts at the same time. Returns
+# {host: (rtts in seconds of the connects that made it, connects tried)}
+def probe(hosts: list, port: int = 22, count: int = 3, timeout: float = 2) -> dict:
+    return asyncio.run(_probe_all(hosts, port, count, timeout))
+
+
+async def _probe_all(hosts, port, count, timeout):
+    results = await asyncio.gather(*(
+        _probe(host, port, count, timeout) for host in hosts))
+    return dict(zip(hosts, results))
+
+
+async def _probe(host, port, count, timeout):
+    loop = asyncio.get_running_loop()
+    try:
+        addresses = await asyncio.wait_for(loop.getaddrinfo(
+            host, port, type=socket.SOCK_STREAM), timeout)
+        address = addresses[0][4][0]
+    except (OSError, asyncio.TimeoutError):
+        return [], count
+
+    rtts = []
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(address, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            continue
+        rtts.append(time.perf_counter() - start)
+        writer.close()
+    return rtts, count
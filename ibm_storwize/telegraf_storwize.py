@@ -1,14 +1,24 @@
 import os
 import sys
 import json
+import time
 import traceback
-import subprocess
-import logging
-import logging.handlers
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import paramiko
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.logs import get_logger
+from common.influx import LineWriter, DeadlineWriter
+from common.execd import triggers, parse_args, exit_now
+from cli import Table, parse_detailed
+from probe import probe
+from iostats import Iostats
+
 TAG_HOST = "storage"
+MEASUREMENT = "storwize"
+TAGS = [TAG_HOST, "pool", "iogroup", "error_code", "volume", "mdisk"]
 
 LOG_DIRECTORY = "/var/log/telegraf/scripts/"
 LOG_FILENAME = f"{os.path.basename(__file__)}_error.log"
@@ -17,10 +27,39 @@ LOG_MAXSIZE = 1048576
 
 SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 HOSTS_FILENAME = f"{SCRIPT_DIRECTORY}/storages.csv"
+# per array: the last event log sequence number seen and the capacity
+# series last written
+STATE_FILENAME = "/var/lib/telegraf/storwize_state.json"
 
 USER = "user"
 PASSWORD = "password"
 
+MAX_WORKERS = 16
+# seconds for the SSH connect and for each CLI command
+SSH_TIMEOUT = 30
+# seconds one array may take in total before its results are dropped
+HOST_TIMEOUT = 120
+# seconds between keepalives on the sessions kept open in execd mode
+SSH_KEEPALIVE = 30
+SSH_PORT = 22
+
+# Capacity and pools change slowly: they are read every CAPACITY_INTERVAL
+# seconds and a series is only written when one of its values moved by more
+# than CAPACITY_THRESHOLD (relative) or CAPACITY_HEARTBEAT seconds passed
+# since it was last written
+CAPACITY_INTERVAL = 900
+CAPACITY_HEARTBEAT = 3600
+CAPACITY_THRESHOLD = 0.001
+
+# Statistics dumps read for per-volume (Nv) and per-mdisk (Nm) rates, an
+# empty list turns the iostats collection off. Only read in execd mode, where
+# the previous dump of every node is kept between collections
+IOSTATS_PREFIXES = ["Nv", "Nm"]
+
+# TCP connects to SSH_PORT of every array before it is polled
+PROBE_COUNT = 3
+PROBE_TIMEOUT = 2  # seconds
+
 METRICS = {
     "capacity": {
         "compression": [
@@ -56,88 +95,75 @@ METRICS = {
 }
 
 
-def log(message: str) -> None:
-    log_handler = logging.handlers.RotatingFileHandler(
-        f"{LOG_DIRECTORY}/{LOG_FILENAME}",
-        maxBytes=LOG_MAXSIZE,
-        backupCount=5)
-    formatter = logging.Formatter(
-        "%(asctime)s %(message)s", LOG_TIMEFORMAT)
-    log_handler.setFormatter(formatter)
-    logger = logging.getLogger()
-    logger.addHandler(log_handler)
-    logger.error(message)
+LOGGER = get_logger(
+    f"{LOG_DIRECTORY}/{LOG_FILENAME}", LOG_MAXSIZE, timeformat=LOG_TIMEFORMAT)
+
+
+def capacity_moved(value, last) -> bool:
+    if isinstance(value, (int, float)) and isinstance(last, (int, float)):
+        return abs(value - last) > CAPACITY_THRESHOLD * abs(last)
+    return value != last
 
 
 class Storwize:
-    def __init__(self, host, user, password):
+    def __init__(self, host, user, password, port=SSH_PORT):
         self.host = host
         self.user = user
         self.password = password
+        self.port = port
 
         self.host_tag = "storage"
         self.ssh_client = None
+        self.last_sequence = None
+        self.iostats = None
+        self.capacity_time = 0
+        # series tags: [fields, time written]
+        self.capacity_series = {}
 
     def __del__(self):
+        self.close()
+
+    def close(self) -> None:
         if self.ssh_client:
             self.ssh_client.close()
+            self.ssh_client = None
 
-    def _get_data(
-            self, metrics_data, metrics, entity_pos=None, tag=None, entity=None):
-        result = []
-        series = {}
-        if metrics:
-            for metric_name in metrics:
-                for data in metrics_data:
-                    if metric_name in data.split(":"):
-                        series[self.host_tag] = self.host
-                        if entity_pos:
-                            metric_value = data.split(":")[entity_pos]
-                            series[tag] = entity
-                        else:
-                            metric_value = data.split(":")[1]
-                        series[metric_name] = int(metric_value)
-        else:
-            result.extend(metrics_data)
+    def connected(self) -> bool:
+        transport = self.ssh_client.get_transport() if self.ssh_client else None
+        return bool(transport and transport.is_active())
 
-        if series:
-            result.append(series)
-        return result
+    def _exec(self, command: str) -> list:
+        self.ssh_connect()
+        try:
+            _, stdout, _ = self.ssh_client.exec_command(
+                command, timeout=SSH_TIMEOUT)
+        except paramiko.SSHException:
+            # The array dropped the session since the last command
+            self.close()
+            self.ssh_connect()
+            _, stdout, _ = self.ssh_client.exec_command(
+                command, timeout=SSH_TIMEOUT)
+        return self._get_ssh_output(stdout)
 
-    def _get_metrics(
-            self, metrics, first_command, entity_pos=None, tag=None):
-        delimiter = "-delim :"
-        result = []
-        full_command = f"{first_command} {delimiter}"
-        _, stdout, _ = self.ssh_client.exec_command(full_command)
-        metrics_data = self._get_ssh_output(stdout)
-        if entity_pos:
-            entities = []
-
-            for data in metrics_data:
-                entity_name = data.split(":")[1]
-                if entity_name not in entities:
-                    entities.append(entity_name)
-            for entity in entities:
-                metrics_data = []
-                _, stdout, _ = self.ssh_client.exec_command(
-                    f"{first_command} {delimiter} {entity}")
-                metrics_data.extend(self._get_ssh_output(stdout))
-                result.extend(self._get_data(
-                    metrics_data, metrics, entity_pos, tag, entity))
-        else:
-            result.extend(self._get_data(metrics_data, metrics))
-        return result
+    # One series per entity, series without any of the metrics are dropped
+    def _get_series(self, values: dict, metrics: list, tag=None, entity=None):
+        series = {self.host_tag: self.host}
+        if tag:
+            series[tag] = str(entity)
+        for metric_name in metrics:
+            if metric_name in values:
+                series[metric_name] = values[metric_name]
+        return [series] if len(series) > (2 if tag else 1) else []
 
-    def get_avail_metric(self) -> dict:
-        response = subprocess.call(
-            f"ping -c 1 {self.host}".split(),
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL)
+    # avail keeps the ping exit code convention: 0 reachable, 1 not
+    def get_avail_metric(self, rtts: list, count: int) -> dict:
         result = {
             self.host_tag: self.host,
-            "avail": response
+            "avail": 0 if rtts else 1,
+            "loss": round((count - len(rtts)) * 100 / count)
         }
+        if rtts:
+            result["rtt_ms"] = round(sum(rtts) / len(rtts) * 1000, 3)
         return result
 
     def _get_ssh_output(self, stdout):
@@ -145,92 +171,311 @@ class Storwize:
         return output
 
     def get_capacity_metrics(self, metrics: list) -> list:
-        command = "lssystem -bytes"
-        result = self._get_metrics(metrics, command)
-        return result
+        command = "lssystem -bytes -delim :"
+        records = parse_detailed(self._exec(command), metrics)
+        return self._get_series(records[0], metrics) if records else []
 
+    # The concise node stats list already holds every node, one row per
+    # node and statistic
     def get_iogroups_metrics(self, metrics: list, command: str) -> list:
-        result = self._get_metrics(metrics, command, 3, "iogroup")
+        table = Table(self._exec(f"{command} -delim :"))
+        if not table.rows:
+            return []
+        nodes = {}
+        for record in table.records(
+                ["node_name", "stat_name"], ["stat_current"]):
+            nodes.setdefault(record["node_name"], {})[
+                record["stat_name"]] = record["stat_current"]
+        result = []
+        for node, values in nodes.items():
+            result.extend(self._get_series(values, metrics, "iogroup", node))
         return result
 
+    # Pool metrics come from the concise list when it has the columns.
+    # Otherwise the detailed view of every pool is requested in one chained
+    # command and split back into pools on the "id" lines
     def get_pools_metrics(self, metrics: list) -> list:
-        command = "lsmdiskgrp -bytes"
-        result = self._get_metrics(metrics, command, 1, "pool")
+        command = "lsmdiskgrp -bytes -delim :"
+        table = Table(self._exec(command))
+        if not table.rows:
+            return []
+        records = list(table.records(["id", "name"], metrics))
+
+        if any(metric_name not in table for metric_name in metrics):
+            detailed = "; ".join(
+                f"{command} {record['id']}" for record in records)
+            records = parse_detailed(self._exec(detailed), metrics)
+
+        result = []
+        for record in records:
+            result.extend(self._get_series(
+                record, metrics, "pool", record.get("name")))
         return result
 
-    def count_alerts(self):
-        command = "lseventlog -message no -nohdr"
-        result = 0
-        alerts = self._get_metrics(None, command)
-        for alert in alerts:
-            error_code = alert.split(":")[-2]
-            if error_code:
-                result += 1
+    # Only unfixed alerts are listed, so the transfer follows the number of
+    # open alerts instead of the length of the event log. Alerts with a
+    # sequence number above the one seen on the previous poll are new
+    def get_alerts(self) -> tuple:
+        command = "lseventlog -fixed no -alert yes -message no -delim :"
+        table = Table(self._exec(command))
+        alerts = {}
+        new_alerts = 0
+        last_sequence = self.last_sequence
+        for record in table.records(["error_code"], ["sequence_number"]):
+            error_code = record.get("error_code")
+            if not error_code:
+                continue
+            alerts[error_code] = alerts.get(error_code, 0) + 1
+            sequence = record.get("sequence_number")
+            if not isinstance(sequence, int):
+                continue
+            if self.last_sequence is not None and sequence > self.last_sequence:
+                new_alerts += 1
+            if last_sequence is None or sequence > last_sequence:
+                last_sequence = sequence
+        self.last_sequence = last_sequence
+        return alerts, new_alerts
+
+    def get_changed_capacity(self, series_list: list, now: float) -> list:
+        result = []
+        capacity_series = {}
+        for series in series_list:
+            key = ",".join(
+                f"{tag}={series[tag]}" for tag in TAGS if tag in series)
+            fields = {
+                name: value for name, value in series.items()
+                if name not in TAGS}
+            last = self.capacity_series.get(key)
+            if (last is None or now - last[1] >= CAPACITY_HEARTBEAT
+                    or fields.keys() != last[0].keys()
+                    or any(
+                        capacity_moved(value, last[0][name])
+                        for name, value in fields.items())):
+                last = [fields, now]
+                result.append(series)
+            capacity_series[key] = last
+        self.capacity_series = capacity_series
         return result
 
     def get_system_metrics(self, metrics: list) -> list:
-        command = "lssystemstats"
-        result = self._get_metrics(metrics, command)
-        return result
+        command = "lssystemstats -delim :"
+        table = Table(self._exec(command))
+        if not table.rows:
+            return []
+        return self._get_series(
+            table.mapping("stat_name", "stat_current"), metrics)
 
     def set_host_tag(self, tag: str) -> None:
         self.host_tag = tag
 
+    # Reuses the open session if it is still up
     def ssh_connect(self) -> None:
+        if self.connected():
+            return
+        self.close()
         self.ssh_client = paramiko.SSHClient()
         self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.ssh_client.connect(
             self.host,
+            port=self.port,
             username=self.user,
             password=self.password,
-            look_for_keys=False)
+            look_for_keys=False,
+            timeout=SSH_TIMEOUT,
+            banner_timeout=SSH_TIMEOUT,
+            auth_timeout=SSH_TIMEOUT)
+        self.ssh_client.get_transport().set_keepalive(SSH_KEEPALIVE)
 
 
-def main() -> None:
-    result = []
+def log_error(host: str, message: str) -> None:
+    log_message = f"{host}:\n{message}"
+    print(log_message, file=sys.stderr)
+    LOGGER.error(log_message)
+
+
+def collect_iostats(storage: Storwize, writer: LineWriter) -> None:
+    # Dumps that cannot be listed or copied do not affect the other metrics
+    # or the session
+    try:
+        if storage.iostats is None:
+            storage.iostats = Iostats(storage, IOSTATS_PREFIXES, SSH_TIMEOUT)
+        writer.write_all(storage.iostats.collect())
+    except Exception as e:
+        log_error(storage.host, f"iostats: {e!r}")
+
+
+def collect(
+        storage: Storwize, compression: str, writer: LineWriter,
+        iostats: bool = False) -> None:
+    host = storage.host
+    try:
+        storage.ssh_connect()
+        alerts, new_alerts = storage.get_alerts()
+        count_alerts = sum(alerts.values())
+        alerts_metrics = {
+            TAG_HOST: host,
+            "count_alerts": count_alerts,
+            "new_alerts": new_alerts,
+            "health_status": 0
+        }
+        if count_alerts:
+            alerts_metrics["health_status"] = 2
+        writer.write(alerts_metrics)
+        for error_code, count in sorted(alerts.items(), key=str):
+            writer.write({
+                TAG_HOST: host,
+                "error_code": str(error_code),
+                "count_alerts": count
+            })
+        if compression == "compression":
+            pool_capacity_metrics = METRICS["capacity"]["compression"]
+            total_capacity = pool_capacity_metrics
+            iogroups_command = "lsnodestats"
+        else:
+            pool_capacity_metrics = METRICS["capacity"]["nocompression"]["pool"]
+            total_capacity = METRICS["capacity"]["nocompression"]["total"]
+            iogroups_command = "lsnodecanisterstats"
+        now = time.time()
+        if now - storage.capacity_time >= CAPACITY_INTERVAL:
+            writer.write_all(storage.get_changed_capacity([
+                *storage.get_capacity_metrics(total_capacity),
+                *storage.get_pools_metrics(pool_capacity_metrics)], now))
+            storage.capacity_time = now
+        writer.write_all(storage.get_system_metrics(
+            METRICS["statistic"]))
+        writer.write_all(storage.get_iogroups_metrics(
+            METRICS["iogroup"], iogroups_command))
+        if iostats and IOSTATS_PREFIXES:
+            collect_iostats(storage, writer)
+
+    except:
+        log_error(host, traceback.format_exc())
+        # Start the next collection on a fresh session
+        storage.close()
+
+    writer.flush()
+
+
+def get_storages() -> list:
+    storages = []
     try:
         with open(HOSTS_FILENAME) as file:
-            hosts_data = file.read().splitlines()
-            for data in hosts_data:
-                host, compression = data.split(",")
-                storage = Storwize(host, USER, PASSWORD)
-                storage.ssh_connect()
-                storage.set_host_tag(TAG_HOST)
-                count_alerts = storage.count_alerts()
-                alerts_metrics = {
-                    TAG_HOST: host,
-                    "count_alerts": count_alerts,
-                    "health_status": 0
-                }
-                if count_alerts:
-                    alerts_metrics["health_status"] = 2
-                result.append(alerts_metrics)
-                if compression == "compression":
-                    pool_capacity_metrics = METRICS["capacity"]["compression"]
-                    total_capacity = pool_capacity_metrics
-                    iogroups_command = "lsnodestats"
-                else:
-                    pool_capacity_metrics = METRICS["capacity"]["nocompression"]["pool"]
-                    total_capacity = METRICS["capacity"]["nocompression"]["total"]
-                    iogroups_command = "lsnodecanisterstats"
-                result.extend(storage.get_capacity_metrics(
-                    total_capacity))
-                result.extend(storage.get_pools_metrics(
-                    pool_capacity_metrics))
-                result.extend(storage.get_system_metrics(
-                    METRICS["statistic"]))
-                result.extend(storage.get_iogroups_metrics(
-                    METRICS["iogroup"], iogroups_command))
-                result.append(storage.get_avail_metric())
+            for data in file.read().splitlines():
+                if data.strip():
+                    host, compression = data.split(",")
+                    storage = Storwize(host, USER, PASSWORD)
+                    storage.set_host_tag(TAG_HOST)
+                    storages.append((storage, compression))
+    except:
+        log_error(HOSTS_FILENAME, traceback.format_exc())
+    load_state(storages)
+    return storages
 
+
+def load_state(storages: list) -> None:
+    try:
+        with open(STATE_FILENAME) as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return
     except:
-        log_message = f"{host}:\n{traceback.format_exc()}"
-        print(log_message, file=sys.stderr)
-        log(log_message)
-        pass
+        log_error(STATE_FILENAME, traceback.format_exc())
+        return
+    for storage, _ in storages:
+        host_state = state.get(storage.host, {})
+        storage.last_sequence = host_state.get("last_sequence")
+        storage.capacity_time = host_state.get("capacity_time", 0)
+        storage.capacity_series = host_state.get("capacity_series", {})
+
 
-    print(json.dumps(result, indent=2))
+def save_state(storages: list) -> None:
+    state = {
+        storage.host: {
+            "last_sequence": storage.last_sequence,
+            "capacity_time": storage.capacity_time,
+            "capacity_series": storage.capacity_series
+        }
+        for storage, _ in storages}
+    try:
+        with open(f"{STATE_FILENAME}.tmp", "w") as file:
+            json.dump(state, file)
+        os.replace(f"{STATE_FILENAME}.tmp", STATE_FILENAME)
+    except:
+        log_error(STATE_FILENAME, traceback.format_exc())
+
+
+# Arrays are probed first and only the reachable ones are polled, all of
+# them concurrently. Series are written as each array produces them; an
+# array that hangs past HOST_TIMEOUT is reported, no longer waited for and
+# the series it produces later are dropped.
+# running keeps the futures by host across cycles so an array still busy
+# with the previous cycle is not polled twice at once
+def poll(
+        executor: ThreadPoolExecutor, storages: list, running: dict,
+        writer: LineWriter, iostats: bool = False) -> None:
+    deadline = time.monotonic() + HOST_TIMEOUT
+    collect_writer = DeadlineWriter(writer, deadline)
+    hosts = []
+    probes = probe(
+        [storage.host for storage, _ in storages],
+        SSH_PORT, PROBE_COUNT, PROBE_TIMEOUT)
+    for storage, compression in storages:
+        rtts, count = probes[storage.host]
+        writer.write(storage.get_avail_metric(rtts, count))
+        if not rtts:
+            continue
+        future = running.get(storage.host)
+        if future and not future.done():
+            log_error(storage.host, "previous collection is still running")
+            continue
+        running[storage.host] = executor.submit(
+            collect, storage, compression, collect_writer, iostats)
+        hosts.append(storage.host)
+    writer.flush()
+
+    wait([running[host] for host in hosts],
+         timeout=max(0, deadline - time.monotonic()))
+    for host in hosts:
+        if not running[host].done():
+            log_error(host, f"not finished after {HOST_TIMEOUT} seconds")
+    save_state(storages)
+
+
+def main() -> None:
+    storages = get_storages()
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    running = {}
+    poll(executor, storages, running, LineWriter(MEASUREMENT, TAGS))
+    executor.shutdown(wait=False, cancel_futures=True)
+    late = False
+    for storage, _ in storages:
+        future = running.get(storage.host)
+        if future is None or future.done():
+            storage.close()
+        else:
+            late = True
+    if late:
+        exit_now()
+
+
+# telegraf execd mode: the sessions stay open between collections.
+def execd(interval: float = None) -> None:
+    storages = get_storages()
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    writer = LineWriter(MEASUREMENT, TAGS)
+    running = {}
+    try:
+        for _ in triggers(interval):
+            poll(executor, storages, running, writer, iostats=True)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for storage, _ in storages:
+            storage.close()
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.execd:
+        execd(args.interval)
+    else:
+        main()
@@ -9,11 +9,14 @@ import logging
 import logging.handlers
 from datetime import datetime, timedelta
 
-from pyzabbix import ZabbixMetric, ZabbixSender
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.service import Service
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.zabbix import ZabbixSink
+
 
 ZABBIX_SERVER = "zabbix.domain.local"
 ZABBIX_HOST = "nicru"
@@ -47,16 +50,10 @@ def log_setup():
     logger.addHandler(log_handler)
 
 
-class Zabbix:
-    def __init__(self, zabbix_server):
-        self.zabbix_server = zabbix_server
-        self.packet = []
-
-    def add_metric(self, zabbix_host, key, value):
-        self.packet.append(ZabbixMetric(zabbix_host, key, value))
-
-    def send(self):
-        ZabbixSender(ZABBIX_SERVER).send(self.packet)
+def zabbix_send(zabbix):
+    response = zabbix.flush()
+    logging.info(
+        f"zabbix processed: {response.processed} failed: {response.failed}")
 
 
 def get_discovery_data(accounts):
@@ -71,7 +68,7 @@ def get_discovery_data(accounts):
 def main():
 
     log_setup()
-    zabbix = Zabbix(ZABBIX_SERVER)
+    zabbix = ZabbixSink(ZABBIX_SERVER)
     date_feature = datetime.now() + timedelta(days=TERM)
     url = URL_PREFIX + date_feature.strftime("%d.%m.%Y")
 
@@ -108,12 +105,12 @@ def main():
                     By.CLASS_NAME, "good2").find_elements(
                         By.TAG_NAME, "strong")[1].text
                 balance_after_date = balance_after_date.split(".")[0]
-                zabbix.add_metric(
+                zabbix.add(
                     ZABBIX_HOST,
                     f"nicru.balance.[{account}]",
                     balance
                 )
-                zabbix.add_metric(
+                zabbix.add(
                     ZABBIX_HOST,
                     f"nicru.balance_after_{TERM}_days.[{account}]",
                     balance_after_date
@@ -130,17 +127,17 @@ def main():
                 pass
 
         else:
-            zabbix.add_metric(ZABBIX_HOST, "nicru.balance.status", 0)
-            zabbix.send()
+            zabbix.add(ZABBIX_HOST, "nicru.balance.status", 0)
+            zabbix_send(zabbix)
             exit()
 
-    zabbix.add_metric(
+    zabbix.add(
         ZABBIX_HOST,
         "nicru.discovery",
         get_discovery_data(ACCOUNTS)
     )
-    zabbix.add_metric(ZABBIX_HOST, "nicru.balance.status", 1)
-    zabbix.send()
+    zabbix.add(ZABBIX_HOST, "nicru.balance.status", 1)
+    zabbix_send(zabbix)
 
 
 if __name__ == "__main__":
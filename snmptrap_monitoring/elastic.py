@@ -0,0 +1,76 @@
+import time
+import uuid
+from datetime import datetime
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+
+
+class ElasticSink:
+    def __init__(
+            self, clusters, batch_size=500, flush_interval=1, on_failure=None):
+        self.clients = {
+            f"elastic:{cluster[0]}": Elasticsearch(cluster)
+            for cluster in clusters}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_failure = on_failure
+        self.actions = []
+        self.flush_time = time.monotonic()
+
+    def add(self, source, message):
+        now = datetime.now()
+        document = dict(message)
+        document["@timestamp"] = now.astimezone().isoformat()
+        document["vision"] = "sys"
+        self.actions.append({
+            "_op_type": "create",
+            "_index": f"{source}-{now.utcnow().strftime('%Y.%m.%d')}",
+            # The random part keeps documents added in the same microsecond
+            # apart; the id is spooled with the action, so a create conflict
+            # means the document is already indexed
+            "_id": f"id{now.strftime('%Y%m%d%H%M%S%f')}{uuid.uuid4().hex}",
+            "_source": document
+        })
+        if len(self.actions) >= self.batch_size:
+            self.flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flush_time >= self.flush_interval:
+            self.flush()
+
+    def send(self, destination, actions):
+        _, errors = bulk(
+            self.clients[destination],
+            actions,
+            chunk_size=self.batch_size,
+            refresh=False,
+            raise_on_error=False)
+        # Replayed documents that already made it into the index come back
+        # as create conflicts. Ids are unique per document, so a conflict is
+        # never a different document
+        errors = [
+            error for error in errors
+            if error.get("create", {}).get("status") != 409]
+        if errors:
+            raise RuntimeError(
+                f"{destination}: {len(errors)} documents failed, "
+                f"first error: {errors[0]}")
+
+    def flush(self):
+        actions, self.actions = self.actions, []
+        self.flush_time = time.monotonic()
+        if not actions:
+            return
+
+        errors = []
+        for destination in self.clients:
+            try:
+                self.send(destination, actions)
+            except Exception as e:
+                if self.on_failure:
+                    self.on_failure(destination, actions, e)
+                else:
+                    errors.append(e)
+        if errors:
+            raise errors[0]
@@ -1,153 +1,402 @@
-import re
+import os
 import sys
+import json
+import time
+import queue
 import socket
-import logging
-import logging.handlers
-from datetime import datetime
+import asyncio
+import signal
+import argparse
+import functools
+import threading
+import socketserver
 
-from pyzabbix import ZabbixMetric, ZabbixSender
-from elasticsearch import Elasticsearch
+from pyzabbix import ZabbixMetric
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.logs import get_logger
+from common.zabbix import ZabbixSink
+from oids import OidIndex
+from elastic import ElasticSink
+from resolver import Resolver
+from spool import Spool, Replayer
+from storm import StormSuppressor
+from rules import Rules
+from receiver import TrapProtocol
+from stats import StageMetrics
+from trap import read_trap, pdu_trap
 from settings import *
 
 
-def event_parser(event):
+OID_INDEX = OidIndex(SOURCES)
+RULES = Rules(SOURCES, EXCEPTIONS, SNMPTRAP_MISSED_FIELDS, SNMPTRAP_OID_FIELDS)
+
+ZABBIX_DESTINATION = f"zabbix:{ZABBIX_SERVER}"
+METRICS = StageMetrics()
+
+
+def spool_elastic(destination, actions, error):
+    logger(LOG_ERROR, f"{error}\nspooled {len(actions)} documents\n")
+    SPOOL.append(destination, actions)
+
+
+def spool_zabbix(metrics, error):
+    logger(LOG_ERROR, f"{error}\nspooled {len(metrics)} items\n")
+    SPOOL.append(
+        ZABBIX_DESTINATION,
+        [[m.host, m.key, m.value, m.clock] for m in metrics])
+
+
+ELASTIC = ElasticSink(
+    ELASTIC_CLUSTERS, ELASTIC_BULK_SIZE, ELASTIC_FLUSH_INTERVAL, spool_elastic)
+RESOLVER = Resolver(DNS_TTL, DNS_NEGATIVE_TTL, DNS_CACHE_SIZE, DNS_TIMEOUT)
+ZABBIX = ZabbixSink(
+    ZABBIX_SERVER, ZABBIX_PORT, ZABBIX_BATCH_SIZE, ZABBIX_FLUSH_INTERVAL,
+    spool_zabbix)
+ELASTIC.send = METRICS.wrap("elastic", ELASTIC.send)
+ZABBIX.send = METRICS.wrap("zabbix", ZABBIX.send)
+STORM = StormSuppressor(STORM_SUPPRESSION, STORM_MAX_KEYS)
+SPOOL = Spool(
+    SPOOL_DIRECTORY, [*ELASTIC.clients, ZABBIX_DESTINATION],
+    SPOOL_SEGMENT_SIZE, SPOOL_MAX_SIZE)
+
+
+def parse_trap(trap):
     current_system = None
     result = {}
 
-    def _find(value, pattern = " value: (.+)"):
-        if re.findall(f"{value}{pattern}", event):
-            return re.findall(f"{value}{pattern}", event)[0]
-    
-    def _resolve(ip):
-        try:
-            for dname in socket.gethostbyaddr(ip):
-                if isinstance(dname, str):
-                    return dname
-        except socket.error:
-            return ip
-
-    for source_name, source in SOURCES.items():
-        for system in source:
-            for comment, oid in system.items():
-                if _find(oid):
-                    current_system = system
-                    if not source_name in current_system:
-                        result.update({source_name: _resolve(_find("UDP",
-                        pattern=": \[(.+)]:.+>"))})
-                    result.update({comment: _find(oid)})
-
-    if result and "rules" in current_system:
-        if "substitution" in current_system["rules"]:
-            for rule_comment, rule in current_system["rules"]["substitution"].items():
-                for sub_pattern, sub_value in rule.items():
-                    for comment in result.keys():
-                        if re.search(rule_comment, comment):
-                            result[comment] = re.sub(
-                                sub_pattern,
-                                sub_value,
-                                result[comment])
-        if "exceptions" in current_system["rules"]:
-            for exception in current_system["rules"]["exceptions"]:
-                coincidences = 0
-                for comment in exception:
-                    if exception[comment] in result[comment]:
-                        coincidences += 1
-                if coincidences == len(exception):
-                    logger(LOG_PARSED_EVENT_EXCEPTION, f"{result}\n")
-                    exit()
-    return result
-
-
-def zabbix_send(zabbix_host, key, message):
-    metrics = []
-    m = ZabbixMetric(zabbix_host, key, message)
-    metrics.append(m)
-    zbx = ZabbixSender(ZABBIX_SERVER)
-    zbx.send(metrics)
-
-
-def elastic_send(cluster, source, message):
-    now = datetime.now()
-    id_name = f"id{now.strftime('%Y%m%d%H%M%S%f')}"
-    index_name = f"{source}-{now.utcnow().strftime('%Y.%m.%d')}"
-    timestamp = now.astimezone().isoformat()
-    message["@timestamp"] = timestamp
-    message["vision"] = "sys"
-    
-    es = Elasticsearch(cluster)
-    es.create(index=index_name, id=id_name, document=message, refresh=True)
+    fields = {}
+    for oid, _, value in trap.varbinds:
+        for ordinal, *field in OID_INDEX.lookup(oid):
+            fields.setdefault(ordinal, (*field, value))
+
+    for ordinal in sorted(fields):
+        source_name, current_system, comment, value = fields[ordinal]
+        if source_name not in result:
+            start = time.perf_counter()
+            result[source_name] = RESOLVER.resolve(trap.address)
+            METRICS.observe("dns", start)
+        result[comment] = value if isinstance(value, str) else str(value)
+
+    exception = None
+    system_rules = RULES.system(current_system)
+    if result and system_rules:
+        system_rules.substitute(result)
+        exception = system_rules.exception(result)
+    return result, exception
 
 
 def logger(logfile, message):
-    log_handler = logging.handlers.RotatingFileHandler(
+    get_logger(
         f"{LOG_DIRECTORY}/{logfile}",
-        maxBytes=LOG_MAXSIZE,
-        backupCount=5)
-    log_handler.terminator = ""
-    formatter = logging.Formatter(
-        "%(asctime)s.%(msecs)03d %(message)s", LOG_TIMEFORMAT)
-    log_handler.setFormatter(formatter)
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    logger.addHandler(log_handler)
-    logger.info(f"{logfile.split('.')[0].upper()}\n{message}")
-    logger.removeHandler(log_handler)
+        LOG_MAXSIZE,
+        "%(asctime)s.%(msecs)03d %(message)s",
+        LOG_TIMEFORMAT,
+        terminator="").info(f"{logfile.split('.')[0].upper()}\n{message}")
 
 
-def main():
+def send_event(parsed_event, event):
+    for source, monitoring in SENDING_RULES.items():
+        if parsed_event:
+            logger(LOG_PARSED_EVENT, f"{parsed_event}\n")
+
+            zabbix_event = ""
+            for comment, value in parsed_event.items():
+                zabbix_event += f"{comment}: {value}\n"
+
+            if source in parsed_event:
+                if "elastic" in monitoring:
+                    ELASTIC.add(monitoring["elastic"], parsed_event)
+                if "zabbix" in monitoring:
+                    for zabbix_host, zabbix_key in monitoring["zabbix"].items():
+                        ZABBIX.add(zabbix_host, zabbix_key, zabbix_event)
+        else:
+            if source == "other":
+                for zabbix_host, zabbix_key in monitoring["zabbix"].items():
+                    ZABBIX.add(zabbix_host, zabbix_key, event)
+
+
+def dispatch(parsed_event, exception, event):
+    if exception:
+        logger(LOG_PARSED_EVENT_EXCEPTION, f"{parsed_event}\n")
+        return
+    if parsed_event and not STORM.check(parsed_event):
+        return
+    send_event(parsed_event, event)
+
+
+def process(trap):
     try:
-        snmptrap = sys.stdin.readlines()
-        snmptrap_string = "".join(snmptrap)
-        logger(LOG_SNMPTRAP, snmptrap_string)
-
-        event = ""
-        for line in snmptrap:
-            if re.search("UDP", line):
-                event += line
-            for field in SNMPTRAP_MISSED_FIELDS:
-                if re.search(field, line):
-                    line = ""
-            for field in SNMPTRAP_OID_FIELDS:
-                if re.search(field, line):
-                    line = line.replace(" ", " value: ", 1)
-                    line = line.replace(field, "oid: ", 1)
-                    line = line.replace('"', "")
-                    event += line
+        logger(LOG_SNMPTRAP, trap.text)
 
+        start = time.perf_counter()
+        trap_exception = RULES.trap_exception(trap.text)
+        METRICS.observe("trap_exception", start)
+        if trap_exception:
+            logger(LOG_SNMPTRAP_EXCEPTION, trap.text)
+            return
+
+        event = trap.event()
         logger(LOG_EVENT, event)
-        parsed_event = event_parser(event)
-
-        for exception in EXCEPTIONS:
-            if exception in snmptrap_string:
-                logger(LOG_SNMPTRAP_EXCEPTION, snmptrap_string)
-                exit()
-
-        for source, monitoring in SENDING_RULES.items():
-            if parsed_event:
-                logger(LOG_PARSED_EVENT, f"{parsed_event}\n")
-
-                zabbix_event = ""
-                for comment, value in parsed_event.items():
-                    zabbix_event += f"{comment}: {value}\n"
-
-                if source in parsed_event:
-                    if "elastic" in monitoring:
-                        for cluster in ELASTIC_CLUSTERS:
-                            elastic_send(cluster, monitoring["elastic"], parsed_event)
-                    if "zabbix" in monitoring:
-                        for zabbix_host, zabbix_key in monitoring["zabbix"].items():
-                            zabbix_send(zabbix_host, zabbix_key, zabbix_event)
-            else:
-                if source == "other":
-                    for zabbix_host, zabbix_key in monitoring["zabbix"].items():
-                        zabbix_send(zabbix_host, zabbix_key, event)
-        
+
+        start = time.perf_counter()
+        parsed_event, exception = parse_trap(trap)
+        METRICS.observe("parse", start)
+
+        start = time.perf_counter()
+        dispatch(parsed_event, exception, event)
+        METRICS.observe("dispatch", start)
+
     except Exception as e:
         print(e)
-        logger(LOG_ERROR, f"{e}\n{snmptrap_string}\n")
-        pass
+        logger(LOG_ERROR, f"{e}\n{trap.text}\n")
+
+
+def handle(snmptrap):
+    start = time.perf_counter()
+    try:
+        trap = read_trap(snmptrap, RULES.missed_fields, RULES.oid_fields)
+    except Exception as e:
+        logger(LOG_ERROR, f"{e}\n{''.join(snmptrap)}\n")
+        return
+    METRICS.observe("filter", start)
+    process(trap)
+
+
+def handle_pdu(address, varbinds):
+    process(pdu_trap(address, varbinds))
+
+
+def send_summaries(now=None):
+    try:
+        for summary in STORM.expire(now):
+            send_event(summary, "")
+    except Exception as e:
+        logger(LOG_ERROR, f"{e}\n")
+
+
+def flush(force=False):
+    for sink in (ELASTIC, ZABBIX):
+        try:
+            if force:
+                sink.flush()
+            else:
+                sink.maybe_flush()
+        except Exception as e:
+            logger(LOG_ERROR, f"{e}\n")
+
+
+def send_self_metrics(received, interval, queue_size):
+    document = {
+        "Host": socket.gethostname(),
+        "Traps": received,
+        "Traps/sec": round(received / interval, 2),
+        "Queue": queue_size,
+        "Suppressed": STORM.suppressed,
+        "Stages": METRICS.report()
+    }
+    try:
+        if "elastic" in SELF_METRICS:
+            ELASTIC.add(SELF_METRICS["elastic"], document)
+        if "zabbix" in SELF_METRICS:
+            for zabbix_host, zabbix_key in SELF_METRICS["zabbix"].items():
+                ZABBIX.add(zabbix_host, zabbix_key, json.dumps(document))
+    except Exception as e:
+        logger(LOG_ERROR, f"{e}\n")
+
+
+def save_dns_cache():
+    if DNS_CACHE_FILE:
+        try:
+            RESOLVER.save(DNS_CACHE_FILE)
+        except OSError as e:
+            logger(LOG_ERROR, f"{e}\n")
+
+
+def log_replay_error(destination, error):
+    logger(LOG_ERROR, f"replay to {destination} failed: {error}\n")
+
+
+def start_replayers():
+    senders = {
+        destination: functools.partial(ELASTIC.send, destination)
+        for destination in ELASTIC.clients}
+    senders[ZABBIX_DESTINATION] = lambda records: ZABBIX.send(
+        [ZabbixMetric(*record) for record in records])
+
+    replayers = []
+    for destination, send in senders.items():
+        replayer = Replayer(
+            SPOOL, destination, send, SPOOL_BATCH_SIZE,
+            SPOOL_BACKOFF, SPOOL_MAX_BACKOFF, on_error=log_replay_error)
+        replayer.start()
+        replayers.append(replayer)
+    return replayers
+
+
+# Handles one trap in a short-lived process: the sinks only queue, so they
+# are flushed before the process exits
+def handle_once(snmptrap):
+    handle(snmptrap)
+    flush(force=True)
+
+
+def main():
+    start = time.perf_counter()
+    snmptrap = sys.stdin.readlines()
+    METRICS.observe("read", start)
+    handle_once(snmptrap)
+
+
+class TrapRequestHandler(socketserver.StreamRequestHandler):
+    timeout = DAEMON_TIMEOUT
+
+    def handle(self):
+        start = time.perf_counter()
+        snmptrap = self.rfile.read().decode(errors="replace")
+        METRICS.observe("read", start)
+        # Answer at once when the queue is full: the server handles one shim
+        # at a time, and a blocked put would time out every waiting shim
+        try:
+            self.server.traps.put_nowait(
+                (time.perf_counter(), handle,
+                 snmptrap.splitlines(keepends=True)))
+        except queue.Full:
+            return
+        self.wfile.write(b"\n")
+
+
+def worker(traps, replayers):
+    received = 0
+    stats_time = time.monotonic()
+    while True:
+        try:
+            trap = traps.get(timeout=DAEMON_TICK)
+        except queue.Empty:
+            trap = ()
+        if trap is None:
+            send_summaries(float("inf"))
+            flush(force=True)
+            break
+        if trap:
+            queued, handler, *args = trap
+            METRICS.observe("queue", queued)
+            handler(*args)
+            received += 1
+        send_summaries()
+        flush()
+
+        now = time.monotonic()
+        if now - stats_time >= DAEMON_STATS_INTERVAL:
+            logger(LOG_DAEMON,
+                f"traps: {received} "
+                f"traps/sec: {received / (now - stats_time):.2f} "
+                f"queue: {traps.qsize()} "
+                f"suppressed: {STORM.suppressed} "
+                f"zabbix processed: {ZABBIX.processed} "
+                f"zabbix failed: {ZABBIX.failed} "
+                f"dns hits: {RESOLVER.hits} "
+                f"dns misses: {RESOLVER.misses} "
+                f"dns timeouts: {RESOLVER.timeouts} "
+                f"spool replayed: {sum(r.replayed for r in replayers)} "
+                f"spool dropped segments: {SPOOL.dropped}\n")
+            send_self_metrics(received, now - stats_time, traps.qsize())
+            received = 0
+            stats_time = now
+            save_dns_cache()
+
+
+def start_daemon():
+    if DNS_CACHE_FILE:
+        RESOLVER.load(DNS_CACHE_FILE)
+    replayers = start_replayers()
+    traps = queue.Queue(DAEMON_QUEUE_SIZE)
+    trap_worker = threading.Thread(target=worker, args=(traps, replayers))
+    trap_worker.start()
+    return traps, trap_worker, replayers
+
+
+def stop_daemon(traps, trap_worker, replayers):
+    traps.put(None)
+    trap_worker.join()
+    for replayer in replayers:
+        replayer.stop()
+    save_dns_cache()
+
+
+def serve():
+    if os.path.exists(DAEMON_SOCKET):
+        os.unlink(DAEMON_SOCKET)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    traps, trap_worker, replayers = start_daemon()
+    server = socketserver.UnixStreamServer(DAEMON_SOCKET, TrapRequestHandler)
+    server.traps = traps
+    logger(LOG_DAEMON, f"listening on {DAEMON_SOCKET}\n")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        stop_daemon(traps, trap_worker, replayers)
+        os.unlink(DAEMON_SOCKET)
+
+
+def receive():
+    traps, trap_worker, replayers = start_daemon()
+    dropped = 0
+
+    def on_trap(address, varbinds):
+        nonlocal dropped
+        try:
+            traps.put_nowait(
+                (time.perf_counter(), handle_pdu, address, varbinds))
+        except queue.Full:
+            dropped += 1
+
+    loop = asyncio.new_event_loop()
+    endpoints = []
+    try:
+        for port in RECEIVER_PORTS:
+            endpoints.append(loop.run_until_complete(
+                loop.create_datagram_endpoint(
+                    lambda: TrapProtocol(on_trap),
+                    local_addr=(RECEIVER_ADDRESS, port))))
+        logger(LOG_DAEMON,
+            f"receiving traps on {RECEIVER_ADDRESS} ports {RECEIVER_PORTS}\n")
+
+        def log_stats():
+            logger(LOG_DAEMON,
+                f"received: {sum(p.received for _, p in endpoints)} "
+                f"invalid: {sum(p.invalid for _, p in endpoints)} "
+                f"dropped: {dropped}\n")
+            loop.call_later(DAEMON_STATS_INTERVAL, log_stats)
+
+        loop.call_later(DAEMON_STATS_INTERVAL, log_stats)
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        loop.add_signal_handler(signal.SIGINT, loop.stop)
+        loop.run_forever()
+    finally:
+        for transport, _ in endpoints:
+            transport.close()
+        loop.close()
+        stop_daemon(traps, trap_worker, replayers)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--daemon", action="store_true",
+        help=f"receive traps from traphandle.py on {DAEMON_SOCKET}")
+    mode.add_argument(
+        "--receiver", action="store_true",
+        help="receive SNMP traps directly on RECEIVER_PORTS "
+             "instead of through snmptrapd")
+    args = parser.parse_args()
+    if args.daemon:
+        serve()
+    elif args.receiver:
+        receive()
+    else:
+        main()
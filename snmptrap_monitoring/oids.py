@@ -0,0 +1,30 @@
+# OIDs in settings.SOURCES are written without the enterprise prefix, so a
+# varbind matches a system field when one of its dot-aligned suffixes equals
+# the configured OID. Each suffix is one dict lookup, whatever the number of
+# configured systems.
+class OidIndex:
+    def __init__(self, sources):
+        self.fields = {}
+        self.max_depth = 0
+        ordinal = 0
+        for source_name, source in sources.items():
+            for system in source:
+                for comment, oid in system.items():
+                    if comment == "rules":
+                        continue
+                    self.fields.setdefault(oid, []).append(
+                        (ordinal, source_name, system, comment))
+                    self.max_depth = max(self.max_depth, oid.count(".") + 1)
+                    ordinal += 1
+
+    def lookup(self, oid):
+        result = []
+        position = len(oid)
+        for _ in range(self.max_depth):
+            position = oid.rfind(".", 0, position)
+            fields = self.fields.get(oid[position + 1:])
+            if fields:
+                result.extend(fields)
+            if position == -1:
+                break
+        return result
@@ -0,0 +1,211 @@
+import asyncio
+
+
+SNMP_V1 = 0
+SNMP_V2C = 1
+
+TRAP_V1 = 0xA4
+INFORM = 0xA6
+TRAP_V2 = 0xA7
+RESPONSE = 0xA2
+
+SYS_UPTIME = "1.3.6.1.2.1.1.3.0"
+SNMP_TRAP_OID = "1.3.6.1.6.3.1.1.4.1.0"
+SNMP_TRAP_ADDRESS = "1.3.6.1.6.3.18.1.3.0"
+SNMP_TRAPS = "1.3.6.1.6.3.1.1.5"
+
+# Names snmptrapd would print for the notifications matched by EXCEPTIONS
+NOTIFICATION_NAMES = {
+    "1.3.6.1.6.3.1.1.5.1": "SNMPv2-MIB::coldStart",
+    "1.3.6.1.6.3.1.1.5.2": "SNMPv2-MIB::warmStart",
+    "1.3.6.1.6.3.1.1.5.3": "IF-MIB::linkDown",
+    "1.3.6.1.6.3.1.1.5.4": "IF-MIB::linkUp",
+    "1.3.6.1.4.1.8072.4.0.3": "NET-SNMP-AGENT-MIB::nsNotifyRestart"
+}
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def _header(data, position):
+    tag = data[position]
+    length = data[position + 1]
+    position += 2
+    if length & 0x80:
+        count = length & 0x7F
+        length = int.from_bytes(data[position:position + count], "big")
+        position += count
+    end = position + length
+    if end > len(data):
+        raise DecodeError(f"truncated field with tag {tag:#x}")
+    return tag, position, end
+
+
+def _expect(data, position, expected_tag):
+    tag, start, end = _header(data, position)
+    if tag != expected_tag:
+        raise DecodeError(f"expected tag {expected_tag:#x}, got {tag:#x}")
+    return start, end
+
+
+def _oid(data):
+    components = []
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            components.append(value)
+            value = 0
+    if not components:
+        raise DecodeError("empty OID")
+    first = min(components[0] // 40, 2)
+    components[0] -= first * 40
+    return f"{first}.{'.'.join(map(str, components))}"
+
+
+def _string(data):
+    try:
+        return "STRING", data.decode()
+    except UnicodeDecodeError:
+        return "Hex-STRING", data.hex(" ").upper()
+
+
+def _value(tag, data):
+    if tag == 0x02:
+        return "INTEGER", int.from_bytes(data, "big", signed=True)
+    if tag == 0x04:
+        return _string(data)
+    if tag == 0x06:
+        return "OID", _cached_oid(data)
+    if tag == 0x40:
+        return "IpAddress", ".".join(map(str, data))
+    if tag == 0x41:
+        return "Counter32", int.from_bytes(data, "big")
+    if tag == 0x42:
+        return "Gauge32", int.from_bytes(data, "big")
+    if tag == 0x43:
+        return "Timeticks", int.from_bytes(data, "big")
+    if tag == 0x46:
+        return "Counter64", int.from_bytes(data, "big")
+    if tag == 0x05:
+        return "NULL", ""
+    if tag == 0x80:
+        return "noSuchObject", ""
+    if tag == 0x81:
+        return "noSuchInstance", ""
+    if tag == 0x82:
+        return "endOfMibView", ""
+    return "Opaque", data.hex(" ").upper()
+
+
+# Traps of one kind repeat the same OIDs, so decoded OIDs are cached
+_oid_cache = {}
+
+
+def _cached_oid(data):
+    oid = _oid_cache.get(data)
+    if oid is None:
+        if len(_oid_cache) >= 65536:
+            _oid_cache.clear()
+        oid = _oid_cache[data] = _oid(data)
+    return oid
+
+
+def _varbinds(data, position, end):
+    varbinds = []
+    while position < end:
+        # The varbind SEQUENCE header is only checked and skipped
+        if data[position] != 0x30:
+            raise DecodeError(f"expected varbind, got tag {data[position]:#x}")
+        length = data[position + 1]
+        position += 2 + (length & 0x7F if length & 0x80 else 0)
+
+        oid_start, oid_end = _expect(data, position, 0x06)
+        oid = _cached_oid(data[oid_start:oid_end])
+        tag, value_start, value_end = _header(data, oid_end)
+        if tag == 0x04:
+            value_type, value = _string(data[value_start:value_end])
+        else:
+            value_type, value = _value(tag, data[value_start:value_end])
+            if value_type == "OID":
+                value = NOTIFICATION_NAMES.get(value, value)
+        varbinds.append((oid, value_type, value))
+        position = value_end
+    return varbinds
+
+
+# Decodes an SNMP v1 or v2c trap or inform into (pdu type, varbinds), where
+# varbinds are (oid, type, value) tuples with numeric OIDs. A v1 trap is
+# converted to the v2c form the way snmptrapd does it (RFC 3584): uptime and
+# snmpTrapOID first, the agent address last.
+def decode_trap(data):
+    position, end = _expect(data, 0, 0x30)
+    version_start, version_end = _expect(data, position, 0x02)
+    version = int.from_bytes(data[version_start:version_end], "big")
+    _, position = _expect(data, version_end, 0x04)
+    pdu_type, position, pdu_end = _header(data, position)
+
+    if version == SNMP_V1 and pdu_type == TRAP_V1:
+        enterprise_start, position = _expect(data, position, 0x06)
+        enterprise = _oid(data[enterprise_start:position])
+        agent_start, position = _expect(data, position, 0x40)
+        agent = ".".join(map(str, data[agent_start:position]))
+        generic_start, position = _expect(data, position, 0x02)
+        generic = int.from_bytes(data[generic_start:position], "big")
+        specific_start, position = _expect(data, position, 0x02)
+        specific = int.from_bytes(data[specific_start:position], "big")
+        uptime_start, position = _expect(data, position, 0x43)
+        uptime = int.from_bytes(data[uptime_start:position], "big")
+        if generic == 6:
+            trap_oid = f"{enterprise}.0.{specific}"
+        else:
+            trap_oid = f"{SNMP_TRAPS}.{generic + 1}"
+        list_start, list_end = _expect(data, position, 0x30)
+        return pdu_type, [
+            (SYS_UPTIME, "Timeticks", uptime),
+            (SNMP_TRAP_OID, "OID", NOTIFICATION_NAMES.get(trap_oid, trap_oid)),
+            *_varbinds(data, list_start, list_end),
+            (SNMP_TRAP_ADDRESS, "IpAddress", agent)
+        ]
+
+    if version == SNMP_V2C and pdu_type in (TRAP_V2, INFORM):
+        for _ in range(3):  # request-id, error-status, error-index
+            _, position = _expect(data, position, 0x02)
+        list_start, list_end = _expect(data, position, 0x30)
+        return pdu_type, _varbinds(data, list_start, list_end)
+
+    raise DecodeError(
+        f"unsupported SNMP version {version} or PDU type {pdu_type:#x}")
+
+
+def inform_response(data):
+    # A Response to an InformRequest repeats it with the PDU type changed
+    response = bytearray(data)
+    _, position, _ = _header(response, 0)
+    _, _, position = _header(response, position)
+    _, _, position = _header(response, position)
+    response[position] = RESPONSE
+    return bytes(response)
+
+
+class TrapProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_trap):
+        self.on_trap = on_trap
+        self.transport = None
+        self.received = 0
+        self.invalid = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        try:
+            pdu_type, varbinds = decode_trap(data)
+        except (DecodeError, IndexError):
+            self.invalid += 1
+            return
+        if pdu_type == INFORM:
+            self.transport.sendto(inform_response(data), address)
+        self.received += 1
+        self.on_trap(address, varbinds)
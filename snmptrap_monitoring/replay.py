@@ -0,0 +1,162 @@
+import os
+import re
+import sys
+import time
+import glob
+import argparse
+import tempfile
+
+import main
+from elastic import ElasticSink
+from storm import StormSuppressor
+from common.zabbix import ZabbixSink
+
+
+CORPUS_DIRECTORY = f"{os.path.dirname(os.path.abspath(__file__))}/corpus"
+
+# LOG_SNMPTRAP entries written by main.logger()
+SNMPTRAP_HEADER = re.compile(
+    r"^\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}\.\d{3} SNMPTRAP$")
+# Default snmptrapd.log format: a header line, then the varbinds on one line
+# separated by tabs
+SNMPTRAPD_HEADER = re.compile(
+    r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} (\S+) \[(.+)\]:$")
+SNMPTRAPD_VARBIND = re.compile(r"^(\S+) = (?:[\w-]+: )?(.*)$")
+
+
+class Stage:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    def wrap(self, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.total += time.perf_counter() - start
+                self.count += 1
+        return timed
+
+
+class StandInElastic(ElasticSink):
+    def __init__(self):
+        super().__init__([], main.ELASTIC_BULK_SIZE, main.ELASTIC_FLUSH_INTERVAL)
+        self.documents = 0
+
+    def flush(self):
+        self.documents += len(self.actions)
+        super().flush()
+
+
+class StandInZabbix(ZabbixSink):
+    def send(self, metrics):
+        self.processed += len(metrics)
+
+
+# Points the handler at a temporary log directory and stand-in sinks. Storm
+# suppression is off unless storm is set, since replayed traps repeat
+def use_stand_ins(storm=False, no_dns=False):
+    main.LOG_DIRECTORY = tempfile.mkdtemp(prefix="snmptrap_replay_")
+    main.ELASTIC = StandInElastic()
+    main.ZABBIX = StandInZabbix(
+        main.ZABBIX_SERVER, main.ZABBIX_PORT, main.ZABBIX_BATCH_SIZE)
+    if not storm:
+        main.STORM = StormSuppressor({})
+    if no_dns:
+        main.RESOLVER.resolve = lambda ip: ip
+
+
+def read_traps(filename):
+    traps = []
+    trap = None
+    with open(filename, errors="replace") as file:
+        for line in file:
+            if SNMPTRAP_HEADER.match(line):
+                trap = []
+                traps.append(trap)
+                continue
+            header = SNMPTRAPD_HEADER.match(line)
+            if header:
+                trap = [f"{header.group(1)}\n", f"{header.group(2)}\n"]
+                traps.append(trap)
+                for varbind in next(file, "").rstrip("\n").split("\t"):
+                    varbind = SNMPTRAPD_VARBIND.match(varbind)
+                    if varbind:
+                        trap.append(f"{varbind.group(1)} {varbind.group(2)}\n")
+                trap = None
+                continue
+            if trap is not None:
+                trap.append(line)
+    return traps
+
+
+def percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def main_replay():
+    parser = argparse.ArgumentParser(
+        description="Replay captured traps through the handler with "
+                    "stand-in Elasticsearch and Zabbix sinks")
+    parser.add_argument(
+        "files", nargs="*",
+        help="LOG_SNMPTRAP logs or snmptrapd.log files "
+             "(default: the bundled synthetic corpus)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--no-dns", action="store_true",
+        help="use the trap source address instead of resolving it")
+    parser.add_argument(
+        "--storm", action="store_true",
+        help="keep storm suppression on, repeated traps are then suppressed")
+    args = parser.parse_args()
+
+    traps = []
+    for filename in args.files or sorted(glob.glob(f"{CORPUS_DIRECTORY}/*.log")):
+        traps.extend(read_traps(filename))
+    if not traps:
+        sys.exit("no traps found")
+
+    stages = {name: Stage() for name in (
+        "filter", "parse", "dns", "exceptions", "zabbix", "elastic")}
+    use_stand_ins(args.storm, args.no_dns)
+    main.read_trap = stages["filter"].wrap(main.read_trap)
+    main.parse_trap = stages["parse"].wrap(main.parse_trap)
+    main.RESOLVER.resolve = stages["dns"].wrap(main.RESOLVER.resolve)
+    main.RULES.trap_exception = stages["exceptions"].wrap(
+        main.RULES.trap_exception)
+    main.ZABBIX.add = stages["zabbix"].wrap(main.ZABBIX.add)
+    main.ELASTIC.add = stages["elastic"].wrap(main.ELASTIC.add)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for trap in traps:
+            trap_start = time.perf_counter()
+            main.handle(trap)
+            latencies.append(time.perf_counter() - trap_start)
+    elapsed = time.perf_counter() - start
+    main.ELASTIC.flush()
+    main.ZABBIX.flush()
+
+    # DNS lookups happen inside parse_trap
+    stages["parse"].total -= stages["dns"].total
+    latencies.sort()
+    print(f"traps: {len(latencies)} in {elapsed:.3f}s "
+          f"({len(latencies) / elapsed:.0f} traps/sec)")
+    print(f"latency p50: {percentile(latencies, 50) * 1e6:.0f} us "
+          f"p99: {percentile(latencies, 99) * 1e6:.0f} us "
+          f"max: {latencies[-1] * 1e6:.0f} us")
+    print(f"elastic documents: {main.ELASTIC.documents} "
+          f"zabbix items: {main.ZABBIX.processed}")
+    print(f"{'stage':<12}{'calls':>10}{'total ms':>12}{'us/trap':>10}{'share':>8}")
+    for name, stage in stages.items():
+        print(f"{name:<12}{stage.count:>10}{stage.total * 1e3:>12.1f}"
+              f"{stage.total / len(latencies) * 1e6:>10.1f}"
+              f"{stage.total / elapsed:>8.1%}")
+
+
+if __name__ == "__main__":
+    main_replay()
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import socket
+import threading
+from collections import OrderedDict
+
+
+class Resolver:
+    def __init__(self, ttl=3600, negative_ttl=300, size=4096, timeout=1):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.size = size
+        self.timeout = timeout
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    def _lookup(self, ip, result):
+        try:
+            result.append(socket.gethostbyaddr(ip)[0])
+        except Exception:
+            pass
+
+    def _store(self, ip, name, ttl):
+        self.cache[ip] = (name, time.time() + ttl)
+        self.cache.move_to_end(ip)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+    def resolve(self, ip):
+        if not ip:
+            return ip
+        entry = self.cache.get(ip)
+        if entry and entry[1] > time.time():
+            self.cache.move_to_end(ip)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        # gethostbyaddr has no timeout of its own; a hung lookup is left
+        # behind in a daemon thread so it cannot stall the trap or the exit
+        result = []
+        lookup = threading.Thread(
+            target=self._lookup, args=(ip, result), daemon=True)
+        lookup.start()
+        lookup.join(self.timeout)
+        if lookup.is_alive():
+            self.timeouts += 1
+        if result:
+            self._store(ip, result[0], self.ttl)
+            return result[0]
+        self._store(ip, ip, self.negative_ttl)
+        return ip
+
+    def load(self, filename):
+        try:
+            with open(filename) as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for ip, (name, expires) in sorted(
+                entries.items(), key=lambda entry: entry[1][1]):
+            if expires > now:
+                self.cache[ip] = (name, expires)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+    def save(self, filename):
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, "w") as file:
+            json.dump(self.cache, file)
+        os.replace(temp_filename, filename)
@@ -0,0 +1,113 @@
+import re
+from collections import deque
+
+
+# Multi-pattern literal matcher: the patterns are compiled into one automaton,
+# so a search reads the text once whatever the number of patterns. Runs of
+# characters that cannot start a pattern are skipped with a compiled regex.
+class AhoCorasick:
+    def __init__(self, patterns):
+        self.transitions = [{}]
+        self.output = [None]
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.output.append(None)
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            if self.output[state] is None:
+                self.output[state] = pattern
+
+        # Fill in the failure transitions so every step is one dict lookup
+        alphabet = {char for pattern in patterns for char in pattern}
+        fail = [0] * len(self.transitions)
+        states = deque(self.transitions[0].values())
+        while states:
+            state = states.popleft()
+            if self.output[state] is None:
+                self.output[state] = self.output[fail[state]]
+            for char in alphabet:
+                child = self.transitions[state].get(char)
+                if child is None:
+                    target = self.transitions[fail[state]].get(char)
+                    if target:
+                        self.transitions[state][char] = target
+                else:
+                    fail[child] = self.transitions[fail[state]].get(char, 0)
+                    states.append(child)
+
+        first_chars = "".join(sorted(self.transitions[0]))
+        self.start = re.compile(f"[{re.escape(first_chars)}]") if first_chars else None
+
+    def search(self, text):
+        if self.start is None:
+            return None
+        transitions = self.transitions
+        output = self.output
+        state = 0
+        position = 0
+        length = len(text)
+        while position < length:
+            if not state:
+                start = self.start.search(text, position)
+                if not start:
+                    return None
+                position = start.start()
+            state = transitions[state].get(text[position], 0)
+            if output[state] is not None:
+                return output[state]
+            position += 1
+        return None
+
+
+class SystemRules:
+    def __init__(self, rules):
+        self.substitutions = [
+            (re.compile(rule_comment), re.compile(sub_pattern), sub_value)
+            for rule_comment, rule in rules.get("substitution", {}).items()
+            for sub_pattern, sub_value in rule.items()]
+        self.exceptions = rules.get("exceptions", [])
+        self.comment_substitutions = {}
+
+    def substitute(self, result):
+        for comment, value in result.items():
+            substitutions = self.comment_substitutions.get(comment)
+            if substitutions is None:
+                substitutions = [
+                    (sub_pattern, sub_value)
+                    for rule_comment, sub_pattern, sub_value in self.substitutions
+                    if rule_comment.search(comment)]
+                self.comment_substitutions[comment] = substitutions
+            for sub_pattern, sub_value in substitutions:
+                value = sub_pattern.sub(sub_value, value)
+            result[comment] = value
+
+    def exception(self, result):
+        for exception in self.exceptions:
+            if all(value in result.get(comment, "")
+                   for comment, value in exception.items()):
+                return exception
+        return None
+
+
+# settings.py rules compiled once at load: the trap line filters, the
+# EXCEPTIONS list and the per-system substitution and exception rules
+class Rules:
+    def __init__(self, sources, exceptions, missed_fields, oid_fields):
+        self.exceptions = AhoCorasick(exceptions)
+        self.missed_fields = AhoCorasick(missed_fields)
+        # Prefixes of the varbind oids, checked with str.startswith
+        self.oid_fields = tuple(oid_fields)
+        self.systems = {
+            id(system): SystemRules(system["rules"])
+            for source in sources.values()
+            for system in source
+            if "rules" in system}
+
+    def trap_exception(self, snmptrap):
+        return self.exceptions.search(snmptrap)
+
+    def system(self, system):
+        return self.systems.get(id(system))
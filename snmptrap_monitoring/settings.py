@@ -5,9 +5,26 @@ LOG_EVENT = "event.log"
 LOG_PARSED_EVENT = "parsed_event.log"
 LOG_PARSED_EVENT_EXCEPTION = "parsed_event_exception.log"
 LOG_ERROR = "error.log"
+LOG_DAEMON = "daemon.log"
 LOG_TIMEFORMAT = "%Y.%m.%d %H:%M:%S"
 LOG_MAXSIZE = 10485760
 
+DAEMON_SOCKET = "/run/snmptrap_monitoring/main.sock"
+DAEMON_QUEUE_SIZE = 10000
+DAEMON_TIMEOUT = 2  # seconds
+DAEMON_STATS_INTERVAL = 60  # seconds
+DAEMON_TICK = 0.5  # seconds between periodic flushes when idle
+
+# main.py --receiver listens here itself, snmptrapd must not be running
+RECEIVER_ADDRESS = "0.0.0.0"
+RECEIVER_PORTS = [160, 161, 162]
+
+DNS_TTL = 3600  # seconds
+DNS_NEGATIVE_TTL = 300  # seconds
+DNS_CACHE_SIZE = 4096
+DNS_TIMEOUT = 1  # seconds
+DNS_CACHE_FILE = "/var/lib/snmptrap_monitoring/dns_cache.json"  # daemon only
+
 
 ELASTIC_CLUSTERS = [
     [
@@ -20,8 +37,21 @@ ELASTIC_CLUSTERS = [
         "http://es2-monitoring2.domain.local:9200"
     ]
 ]
+ELASTIC_BULK_SIZE = 500  # documents per bulk request
+ELASTIC_FLUSH_INTERVAL = 1  # seconds
 
 ZABBIX_SERVER = "zabbix.domain.local"
+ZABBIX_PORT = 10051
+ZABBIX_BATCH_SIZE = 250  # items per trapper packet
+ZABBIX_FLUSH_INTERVAL = 1  # seconds
+
+# Events that could not be delivered are kept here and replayed by the daemon
+SPOOL_DIRECTORY = "/var/lib/snmptrap_monitoring/spool"
+SPOOL_SEGMENT_SIZE = 16777216
+SPOOL_MAX_SIZE = 1073741824
+SPOOL_BATCH_SIZE = 500
+SPOOL_BACKOFF = 1  # seconds, doubled after every failed replay
+SPOOL_MAX_BACKOFF = 300  # seconds
 
 
 SENDING_RULES = {
@@ -44,6 +74,15 @@ SENDING_RULES = {
     }
 }
 
+# Pipeline stage latencies and counters, sent every DAEMON_STATS_INTERVAL in
+# daemon and receiver mode. The Zabbix item gets the whole document as JSON
+SELF_METRICS = {
+    "zabbix": {
+        "snmptrap-monitoring": "snmptrap_monitoring_stats"
+    },
+    "elastic": "snmptrap_monitoring"
+}
+
 
 SNMPTRAP_MISSED_FIELDS = [
     "<UNKNOWN>",
@@ -113,6 +152,17 @@ SOURCES = {
     ]
 }
 
+# Events with the same keys are forwarded once per window (in seconds); the
+# repeats are counted and forwarded as one summary when the window closes.
+# Works across traps in daemon mode only.
+STORM_SUPPRESSION = {
+    "Storage": {
+        "keys": ["System Name", "Error Code", "Object ID"],
+        "window": 300
+    }
+}
+STORM_MAX_KEYS = 10000
+
 
 EXCEPTIONS = [
     "Space Efficient Virtual Disk Copy space warning",
@@ -0,0 +1,194 @@
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+
+
+# Append-only journal of records that could not be delivered. Every line is
+# "<destination>\t<json record>\n" and lines are appended to numbered segment
+# files. Each destination keeps its own read offset, so a destination that
+# is down does not hold back the others; a segment is removed once every
+# destination has read past it, or when the spool grows beyond max_size.
+# Appends take an flock, so one-shot handlers and the daemon can share it.
+class Spool:
+    def __init__(
+            self, directory, destinations,
+            segment_size=16777216, max_size=1073741824):
+        self.directory = directory
+        self.destinations = list(destinations)
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.lock_filename = os.path.join(directory, "spool.lock")
+        self.offsets_filename = os.path.join(directory, "offsets.json")
+        self.offsets = {}
+        try:
+            with open(self.offsets_filename) as file:
+                self.offsets = {
+                    destination: tuple(offset)
+                    for destination, offset in json.load(file).items()}
+        except (OSError, ValueError):
+            pass
+        self.dropped = 0
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(self.lock_filename, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _segments(self):
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            int(filename[:-4]) for filename in filenames
+            if filename.endswith(".log"))
+
+    def _segment_filename(self, segment):
+        return os.path.join(self.directory, f"{segment:020d}.log")
+
+    def _remove(self, segment):
+        try:
+            os.unlink(self._segment_filename(segment))
+        except FileNotFoundError:
+            pass
+
+    def append(self, destination, records):
+        data = "".join(
+            f"{destination}\t{json.dumps(record)}\n" for record in records
+        ).encode()
+        with self._locked():
+            segments = self._segments() or [0]
+            segment = segments[-1]
+            try:
+                size = os.path.getsize(self._segment_filename(segment))
+            except FileNotFoundError:
+                size = 0
+            if size and size + len(data) > self.segment_size:
+                segment += 1
+                segments.append(segment)
+
+            fd = os.open(
+                self._segment_filename(segment),
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                0o600)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+
+            sizes = {}
+            for segment in segments:
+                try:
+                    sizes[segment] = os.path.getsize(
+                        self._segment_filename(segment))
+                except FileNotFoundError:
+                    pass
+            total_size = sum(sizes.values())
+            for segment in segments[:-1]:
+                if total_size <= self.max_size:
+                    break
+                self._remove(segment)
+                total_size -= sizes.get(segment, 0)
+                self.dropped += 1
+
+    def offset(self, destination):
+        return self.offsets.get(destination, (0, 0))
+
+    def read(self, destination, limit):
+        name = destination.encode()
+        records = []
+        segment, position = self.offset(destination)
+        segments = self._segments()
+        while segments:
+            if segment < segments[0]:
+                # The segment was dropped to keep the spool within max_size
+                segment, position = segments[0], 0
+            try:
+                file = open(self._segment_filename(segment), "rb")
+            except FileNotFoundError:
+                segments = [s for s in segments if s > segment]
+                continue
+            with file:
+                file.seek(position)
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    position += len(line)
+                    line_destination, _, record = line.partition(b"\t")
+                    if line_destination == name:
+                        records.append(json.loads(record))
+                        if len(records) >= limit:
+                            return records, (segment, position)
+
+            later = [s for s in segments if s > segment]
+            if not later:
+                break
+            segment, position = later[0], 0
+        return records, (segment, position)
+
+    def commit(self, destination, offset):
+        with self._locked():
+            self.offsets[destination] = tuple(offset)
+            temp_filename = f"{self.offsets_filename}.tmp"
+            with open(temp_filename, "w") as file:
+                json.dump(self.offsets, file)
+            os.replace(temp_filename, self.offsets_filename)
+
+            first_needed = min(
+                self.offset(destination)[0]
+                for destination in self.destinations)
+            for segment in self._segments():
+                if segment >= first_needed:
+                    break
+                self._remove(segment)
+
+
+class Replayer(threading.Thread):
+    def __init__(
+            self, spool, destination, send, batch_size=500,
+            backoff=1, max_backoff=300, interval=1, on_error=None):
+        super().__init__(name=f"replayer {destination}", daemon=True)
+        self.spool = spool
+        self.destination = destination
+        self.send = send
+        self.batch_size = batch_size
+        self.min_backoff = backoff
+        self.max_backoff = max_backoff
+        self.interval = interval
+        self.on_error = on_error
+        self.stop_event = threading.Event()
+        self.replayed = 0
+
+    def run(self):
+        backoff = self.min_backoff
+        while not self.stop_event.is_set():
+            offset = self.spool.offset(self.destination)
+            records, new_offset = self.spool.read(
+                self.destination, self.batch_size)
+            try:
+                if records:
+                    self.send(records)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(self.destination, e)
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = self.min_backoff
+            if new_offset != offset:
+                self.spool.commit(self.destination, new_offset)
+            self.replayed += len(records)
+            if len(records) < self.batch_size:
+                self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
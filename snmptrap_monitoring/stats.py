@@ -0,0 +1,80 @@
+import time
+import bisect
+import threading
+
+
+# Upper bounds of the latency buckets in seconds, the last bucket is open
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if bucket == len(BUCKETS):
+                    return self.max
+                return min(BUCKETS[bucket], self.max)
+        return 0.0
+
+
+# Stages are observed from the socket handler, the worker and the spool
+# replayers, so the histograms are updated under a lock
+class StageMetrics:
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, start):
+        seconds = time.perf_counter() - start
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def wrap(self, stage, function):
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self.observe(stage, start)
+        return timed
+
+    # Returns the stats of every stage since the previous report and starts
+    # new histograms. Percentiles are bucket upper bounds capped at the max.
+    def report(self):
+        with self.lock:
+            stages, self.stages = self.stages, {}
+        result = {}
+        for stage, histogram in stages.items():
+            result[stage] = {
+                "count": histogram.count,
+                "avg_ms": round(histogram.total / histogram.count * 1e3, 3),
+                "p50_ms": round(histogram.percentile(50) * 1e3, 3),
+                "p99_ms": round(histogram.percentile(99) * 1e3, 3),
+                "max_ms": round(histogram.max * 1e3, 3)
+            }
+        return result
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+
+
+# The first event of every key is forwarded; repeats within the window are
+# only counted and come back from expire() as one summary event when the
+# window closes. Windows of a source are kept in start order, so expiry only
+# looks at the oldest ones, and the oldest window is closed early when a
+# source has more than max_keys open windows.
+class StormSuppressor:
+    def __init__(self, rules, max_keys=10000):
+        self.rules = rules
+        self.max_keys = max_keys
+        self.windows = {source_name: OrderedDict() for source_name in rules}
+        self.summaries = []
+        self.suppressed = 0
+
+    def _summary(self, source_name, event, count):
+        summary = dict(event)
+        summary["Repeat Count"] = count
+        summary["Repeat Window"] = self.rules[source_name]["window"]
+        return summary
+
+    def check(self, event, now=None):
+        for source_name, rule in self.rules.items():
+            if source_name in event:
+                break
+        else:
+            return True
+
+        now = time.monotonic() if now is None else now
+        windows = self.windows[source_name]
+        key = tuple(event.get(field) for field in rule["keys"])
+        window = windows.get(key)
+        if window:
+            window[2] += 1
+            self.suppressed += 1
+            return False
+
+        windows[key] = [now, event, 0]
+        if len(windows) > self.max_keys:
+            _, (_, oldest_event, count) = windows.popitem(last=False)
+            if count:
+                self.summaries.append(
+                    self._summary(source_name, oldest_event, count))
+        return True
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        for source_name, windows in self.windows.items():
+            window_size = self.rules[source_name]["window"]
+            while windows:
+                key, (start, event, count) = next(iter(windows.items()))
+                if now - start < window_size:
+                    break
+                del windows[key]
+                if count:
+                    self.summaries.append(
+                        self._summary(source_name, event, count))
+        summaries, self.summaries = self.summaries, []
+        return summaries
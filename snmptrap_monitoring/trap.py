@@ -0,0 +1,80 @@
+# A trap as the rest of the pipeline sees it: the raw text for the logs and
+# the exception check, the transport line with the source address and the
+# varbinds as (oid, type, value). type is None for traps read from snmptrapd
+class Trap:
+    __slots__ = ("text", "transport", "address", "varbinds")
+
+    def __init__(self, text, transport, address, varbinds):
+        self.text = text
+        self.transport = transport
+        self.address = address
+        self.varbinds = varbinds
+
+    # The form written to LOG_EVENT and sent on the "other" route
+    def event(self):
+        return self.transport + "".join(
+            f"oid: {oid} value: {value}\n" for oid, _, value in self.varbinds)
+
+
+# Builds a Trap from the traphandle input in one pass. Lines matching
+# missed_fields are dropped, lines whose oid starts with one of the
+# oid_fields prefixes become varbinds with the prefix cut from the oid and
+# the quotes from the value
+def read_trap(lines, missed_fields, oid_fields):
+    transport = ""
+    address = None
+    varbinds = []
+    for line in lines:
+        if address is None and "UDP: [" in line:
+            transport = line if line.endswith("\n") else f"{line}\n"
+            address = line[line.index("UDP: [") + 6:].partition("]:")[0]
+        if missed_fields.search(line):
+            continue
+        name, _, value = line.rstrip("\r\n").partition(" ")
+        if name.startswith(oid_fields):
+            for field in oid_fields:
+                if name.startswith(field):
+                    varbinds.append(
+                        (name[len(field):], None, value.replace('"', "")))
+                    break
+    return Trap("".join(lines), transport, address, varbinds)
+
+
+# Varbinds snmptrapd puts in every trap, with the names it prints for them.
+# missed_fields drops their traphandle lines, so the receiver leaves them
+# out of the varbinds by oid
+TRAP_FIELD_NAMES = {
+    "1.3.6.1.2.1.1.3.0": "DISMAN-EVENT-MIB::sysUpTimeInstance",
+    "1.3.6.1.6.3.1.1.4.1.0": "SNMPv2-MIB::snmpTrapOID.0",
+    "1.3.6.1.6.3.1.1.4.3.0": "SNMPv2-MIB::snmpTrapEnterprise.0",
+    "1.3.6.1.6.3.18.1.3.0": "SNMP-COMMUNITY-MIB::snmpTrapAddress.0",
+    "1.3.6.1.6.3.18.1.4.0": "SNMP-COMMUNITY-MIB::snmpTrapCommunity.0"
+}
+
+
+# Builds a Trap from a PDU decoded by the receiver, keeping the decoded
+# types. snmptrapd prints numeric oids under the "iso." root that read_trap
+# cuts, so the leading "1." is cut here and OID values get the "iso." root;
+# string values lose their quotes the same way. The text is rendered in the
+# traphandle format for the logs and the exception check only
+def pdu_trap(address, varbinds):
+    ip, port = address[:2]
+    transport = f"UDP: [{ip}]:{port}\n"
+    lines = [f"{ip}\n", transport]
+    trap_varbinds = []
+    for oid, value_type, value in varbinds:
+        if value_type == "STRING":
+            value = value.replace('"', "")
+            text_value = f'"{value}"'
+        elif value_type == "OID" and value.startswith("1."):
+            value = text_value = f"iso.{value[2:]}"
+        else:
+            text_value = value
+        name = TRAP_FIELD_NAMES.get(oid)
+        if name is None:
+            if oid.startswith("1."):
+                oid = oid[2:]
+            trap_varbinds.append((oid, value_type, value))
+            name = f"iso.{oid}"
+        lines.append(f"{name} {text_value}\n")
+    return Trap("".join(lines), transport, ip, trap_varbinds)
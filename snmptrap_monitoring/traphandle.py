@@ -0,0 +1,31 @@
+import sys
+import socket
+
+from settings import DAEMON_SOCKET, DAEMON_TIMEOUT
+
+
+def forward(snmptrap):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(DAEMON_TIMEOUT)
+        sock.connect(DAEMON_SOCKET)
+        sock.sendall(snmptrap)
+        sock.shutdown(socket.SHUT_WR)
+        return sock.recv(1) == b"\n"
+
+
+def main():
+    snmptrap = sys.stdin.buffer.read()
+    try:
+        if forward(snmptrap):
+            return
+    except OSError:
+        pass
+
+    # The daemon is not running or is overloaded: handle the trap in this
+    # process the same way the plain traphandle does
+    import main as handler
+    handler.handle_once(snmptrap.decode(errors="replace").splitlines(keepends=True))
+
+
+if __name__ == "__main__":
+    main()
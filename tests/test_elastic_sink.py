@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import time
+import threading
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "snmptrap_monitoring"))
+
+import elastic
+from elastic import ElasticSink
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _answer(self, status, body):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.end_headers()
+        self.wfile.write(body)
+
+    # The client sends bulk requests as POST or, in newer versions, PUT
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        url = urlsplit(self.path)
+        if self.server.status != 200:
+            self._answer(self.server.status, {"error": "unavailable"})
+            return
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        actions = list(zip(lines[::2], lines[1::2]))
+        self.server.requests.append((url.path, parse_qs(url.query), actions))
+        self._answer(200, {
+            "took": 1,
+            "errors": False,
+            "items": [
+                {op: {"_index": meta[op]["_index"], "status": 201}}
+                for meta, _ in actions
+                for op in meta]})
+
+    do_PUT = do_POST
+
+
+# Local stand-in for one Elasticsearch cluster that records the bulk
+# requests it gets, or answers all of them with status
+class FakeElastic(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, status=200):
+        super().__init__(("127.0.0.1", 0), BulkHandler)
+        self.status = status
+        self.requests = []
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ElasticSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.elastic = FakeElastic()
+        self.addCleanup(self.elastic.close)
+
+    def sink(
+            self, clusters, batch_size=3, flush_interval=0.2, on_failure=None):
+        return ElasticSink(
+            [[cluster.url] for cluster in clusters],
+            batch_size, flush_interval, on_failure)
+
+    def test_waits_for_interval_below_batch_size(self):
+        sink = self.sink([self.elastic])
+        sink.add("trap", {"Event": "1"})
+        sink.add("trap", {"Event": "2"})
+        sink.maybe_flush()
+        self.assertEqual(self.elastic.requests, [])
+
+        time.sleep(0.2)
+        sink.maybe_flush()
+        self.assertEqual(len(self.elastic.requests), 1)
+        self.assertEqual(len(self.elastic.requests[0][2]), 2)
+
+    def test_flushes_full_batch(self):
+        sink = self.sink([self.elastic], flush_interval=60)
+        for number in range(7):
+            sink.add("trap", {"Event": str(number)})
+        self.assertEqual(
+            [len(actions) for _, _, actions in self.elastic.requests], [3, 3])
+        sink.flush()
+        self.assertEqual(
+            [len(actions) for _, _, actions in self.elastic.requests],
+            [3, 3, 1])
+
+    def test_bulk_request(self):
+        sink = self.sink([self.elastic])
+        sink.add("fs5100", {"Event": "1"})
+        sink.flush()
+        path, query, actions = self.elastic.requests[0]
+        self.assertEqual(path, "/_bulk")
+        self.assertEqual(query["refresh"], ["false"])
+        (meta, document), = actions
+        day = datetime.now(timezone.utc).strftime("%Y.%m.%d")
+        self.assertEqual(meta["create"]["_index"], f"fs5100-{day}")
+        self.assertEqual(document["Event"], "1")
+
+    def test_unique_ids(self):
+        sink = self.sink([self.elastic], batch_size=1000)
+        # Every document is added in the same microsecond
+        now = datetime.now()
+        with patch.object(elastic, "datetime") as clock:
+            clock.now.return_value = now
+            for number in range(1000):
+                sink.add("trap", {"Event": str(number)})
+        sink.flush()
+        ids = {meta["create"]["_id"] for _, _, actions in self.elastic.requests
+               for meta, _ in actions}
+        self.assertEqual(len(ids), 1000)
+
+    def test_failed_cluster_does_not_block_other(self):
+        failing = FakeElastic(status=500)
+        self.addCleanup(failing.close)
+        failures = []
+        sink = self.sink(
+            [failing, self.elastic],
+            on_failure=lambda destination, actions, error: failures.append(
+                (destination, len(actions))))
+        sink.add("trap", {"Event": "1"})
+        sink.flush()
+        self.assertEqual(failures, [(f"elastic:{failing.url}", 1)])
+        self.assertEqual(len(self.elastic.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "snmptrap_monitoring"))
+
+from receiver import (
+    TrapProtocol, DecodeError, decode_trap, inform_response,
+    TRAP_V1, TRAP_V2, INFORM, RESPONSE)
+
+
+def tlv(tag, payload, long_form=False):
+    length = len(payload)
+    if length < 0x80 and not long_form:
+        return bytes([tag, length]) + payload
+    size = max(1, (length.bit_length() + 7) // 8)
+    return bytes([tag, 0x80 | size]) + length.to_bytes(size, "big") + payload
+
+
+def integer(value, tag=0x02):
+    size = max(1, (value.bit_length() + 8) // 8)
+    return tlv(tag, value.to_bytes(size, "big", signed=True))
+
+
+def unsigned(value, tag):
+    size = max(1, (value.bit_length() + 7) // 8)
+    return tlv(tag, value.to_bytes(size, "big"))
+
+
+def oid(text):
+    components = [int(component) for component in text.split(".")]
+    payload = bytearray([components[0] * 40 + components[1]])
+    for component in components[2:]:
+        chunk = [component & 0x7F]
+        component >>= 7
+        while component:
+            chunk.append(0x80 | (component & 0x7F))
+            component >>= 7
+        payload.extend(reversed(chunk))
+    return tlv(0x06, bytes(payload))
+
+
+def varbind_list(varbinds, long_form=False):
+    return tlv(0x30, b"".join(
+        tlv(0x30, oid(name) + value, long_form) for name, value in varbinds),
+        long_form)
+
+
+def v2c(pdu_type, varbinds, long_form=False):
+    pdu = tlv(
+        pdu_type,
+        integer(1234) + integer(0) + integer(0)
+        + varbind_list(varbinds, long_form),
+        long_form)
+    return tlv(0x30, integer(1) + tlv(0x04, b"public") + pdu, long_form)
+
+
+def v1(enterprise, agent, generic, specific, uptime, varbinds):
+    pdu = tlv(
+        TRAP_V1,
+        oid(enterprise) + tlv(0x40, bytes(map(int, agent.split("."))))
+        + integer(generic) + integer(specific) + unsigned(uptime, 0x43)
+        + varbind_list(varbinds))
+    return tlv(0x30, integer(0) + tlv(0x04, b"public") + pdu)
+
+
+class DecodeTrapTest(unittest.TestCase):
+    def test_v2c_types(self):
+        packet = v2c(TRAP_V2, [
+            ("1.3.6.1.2.1.1.3.0", unsigned(123456, 0x43)),
+            ("1.3.6.1.6.3.1.1.4.1.0", oid("1.3.6.1.6.3.1.1.5.3")),
+            ("1.3.6.1.4.1.2.6.190.4.1", tlv(0x04, b"Machine Type = 4662")),
+            ("1.3.6.1.4.1.2.6.190.4.2", tlv(0x04, b"\xff\x00\x10")),
+            ("1.3.6.1.4.1.2.6.190.4.3", integer(-5)),
+            ("1.3.6.1.4.1.2.6.190.4.4", tlv(0x40, bytes([10, 0, 0, 1]))),
+            ("1.3.6.1.4.1.2.6.190.4.5", unsigned(4294967295, 0x41)),
+            ("1.3.6.1.4.1.2.6.190.4.6", unsigned(2 ** 64 - 1, 0x46)),
+            ("1.3.6.1.4.1.2.6.190.4.7", oid("1.3.6.1.4.1.99.1")),
+            ("1.3.6.1.4.1.2.6.190.4.8", tlv(0x05, b""))
+        ])
+        pdu_type, varbinds = decode_trap(packet)
+        self.assertEqual(pdu_type, TRAP_V2)
+        self.assertEqual(varbinds, [
+            ("1.3.6.1.2.1.1.3.0", "Timeticks", 123456),
+            ("1.3.6.1.6.3.1.1.4.1.0", "OID", "IF-MIB::linkDown"),
+            ("1.3.6.1.4.1.2.6.190.4.1", "STRING", "Machine Type = 4662"),
+            ("1.3.6.1.4.1.2.6.190.4.2", "Hex-STRING", "FF 00 10"),
+            ("1.3.6.1.4.1.2.6.190.4.3", "INTEGER", -5),
+            ("1.3.6.1.4.1.2.6.190.4.4", "IpAddress", "10.0.0.1"),
+            ("1.3.6.1.4.1.2.6.190.4.5", "Counter32", 4294967295),
+            ("1.3.6.1.4.1.2.6.190.4.6", "Counter64", 2 ** 64 - 1),
+            ("1.3.6.1.4.1.2.6.190.4.7", "OID", "1.3.6.1.4.1.99.1"),
+            ("1.3.6.1.4.1.2.6.190.4.8", "NULL", "")
+        ])
+
+    def test_v1_enterprise_specific(self):
+        packet = v1(
+            "1.3.6.1.4.1.2.6.190", "10.10.1.12", 6, 3, 4200,
+            [("1.3.6.1.4.1.2.6.190.4.1", tlv(0x04, b"Error Code = 1627"))])
+        pdu_type, varbinds = decode_trap(packet)
+        self.assertEqual(pdu_type, TRAP_V1)
+        self.assertEqual(varbinds, [
+            ("1.3.6.1.2.1.1.3.0", "Timeticks", 4200),
+            ("1.3.6.1.6.3.1.1.4.1.0", "OID", "1.3.6.1.4.1.2.6.190.0.3"),
+            ("1.3.6.1.4.1.2.6.190.4.1", "STRING", "Error Code = 1627"),
+            ("1.3.6.1.6.3.18.1.3.0", "IpAddress", "10.10.1.12")
+        ])
+
+    def test_v1_generic(self):
+        packet = v1("1.3.6.1.4.1.8072", "10.0.0.2", 0, 0, 1, [])
+        _, varbinds = decode_trap(packet)
+        self.assertEqual(varbinds[1], (
+            "1.3.6.1.6.3.1.1.4.1.0", "OID", "SNMPv2-MIB::coldStart"))
+        self.assertEqual(len(varbinds), 3)
+
+    def test_long_form_lengths(self):
+        message = "x" * 300
+        packet = v2c(TRAP_V2, [
+            ("1.3.6.1.4.1.2.6.190.4.18", tlv(0x04, message.encode())),
+            ("1.3.6.1.4.1.2.6.190.4.3", integer(1))
+        ], long_form=True)
+        self.assertEqual(packet[1] & 0x80, 0x80)
+        _, varbinds = decode_trap(packet)
+        self.assertEqual(varbinds, [
+            ("1.3.6.1.4.1.2.6.190.4.18", "STRING", message),
+            ("1.3.6.1.4.1.2.6.190.4.3", "INTEGER", 1)
+        ])
+
+    def test_inform(self):
+        packet = v2c(INFORM, [("1.3.6.1.4.1.2.6.190.4.3", integer(7))])
+        pdu_type, varbinds = decode_trap(packet)
+        self.assertEqual(pdu_type, INFORM)
+        self.assertEqual(varbinds, [("1.3.6.1.4.1.2.6.190.4.3", "INTEGER", 7)])
+
+        response = inform_response(packet)
+        self.assertEqual(len(response), len(packet))
+        changed = [
+            position for position in range(len(packet))
+            if packet[position] != response[position]]
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(response[changed[0]], RESPONSE)
+
+    def test_invalid(self):
+        packet = v2c(TRAP_V2, [("1.3.6.1.4.1.2.6.190.4.3", integer(7))])
+        with self.assertRaises(DecodeError):
+            decode_trap(packet[:-3])
+        snmp_v3 = tlv(0x30, integer(3) + tlv(0x04, b"") + tlv(0xA7, b""))
+        with self.assertRaises(DecodeError):
+            decode_trap(snmp_v3)
+
+
+class Transport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append((data, address))
+
+
+class TrapProtocolTest(unittest.TestCase):
+    def test_datagrams(self):
+        traps = []
+        protocol = TrapProtocol(
+            lambda address, varbinds: traps.append((address, varbinds)))
+        transport = Transport()
+        protocol.connection_made(transport)
+        address = ("10.0.0.1", 50000)
+        trap = v2c(TRAP_V2, [("1.3.6.1.4.1.2.6.190.4.3", integer(1))])
+        inform = v2c(INFORM, [("1.3.6.1.4.1.2.6.190.4.3", integer(2))])
+
+        protocol.datagram_received(trap, address)
+        protocol.datagram_received(inform, address)
+        protocol.datagram_received(b"\x30\x05\x02", address)
+
+        self.assertEqual((protocol.received, protocol.invalid), (2, 1))
+        self.assertEqual([varbinds[0][2] for _, varbinds in traps], [1, 2])
+        self.assertEqual(transport.sent, [(inform_response(inform), address)])
+
+
+if __name__ == "__main__":
+    unittest.main()
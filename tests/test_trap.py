@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "snmptrap_monitoring"))
+
+from rules import Rules
+from trap import read_trap, pdu_trap
+from settings import (
+    SOURCES, EXCEPTIONS, SNMPTRAP_MISSED_FIELDS, SNMPTRAP_OID_FIELDS)
+
+
+RULES = Rules(SOURCES, EXCEPTIONS, SNMPTRAP_MISSED_FIELDS, SNMPTRAP_OID_FIELDS)
+
+# The same trap as snmptrapd passes it to traphandle and as the receiver
+# decodes it
+TRAPHANDLE_INPUT = [
+    "fs5100-2.domain.local\n",
+    "UDP: [10.10.1.12]:161->[10.10.0.5]:162\n",
+    "DISMAN-EVENT-MIB::sysUpTimeInstance 1:2:44:16.56\n",
+    "SNMPv2-MIB::snmpTrapOID.0 iso.3.6.1.4.1.2.6.190.3\n",
+    "iso.3.6.1.4.1.2.6.190.4.1 \"# Machine Type = 4662F12\"\n",
+    "iso.3.6.1.4.1.2.6.190.4.4 \"# Error Code = 1627\"\n",
+    "iso.3.6.1.4.1.2.6.190.4.9 iso.3.6.1.4.1.99\n",
+    "iso.3.6.1.4.1.2.6.190.4.12 40\n",
+    "SNMP-COMMUNITY-MIB::snmpTrapAddress.0 10.10.1.12\n"
+]
+VARBINDS = [
+    ("1.3.6.1.2.1.1.3.0", "Timeticks", 123456),
+    ("1.3.6.1.6.3.1.1.4.1.0", "OID", "1.3.6.1.4.1.2.6.190.3"),
+    ("1.3.6.1.4.1.2.6.190.4.1", "STRING", "# Machine Type = 4662F12"),
+    ("1.3.6.1.4.1.2.6.190.4.4", "STRING", "# Error Code = 1627"),
+    ("1.3.6.1.4.1.2.6.190.4.9", "OID", "1.3.6.1.4.1.99"),
+    ("1.3.6.1.4.1.2.6.190.4.12", "INTEGER", 40),
+    ("1.3.6.1.6.3.18.1.3.0", "IpAddress", "10.10.1.12")
+]
+
+
+class PduTrapTest(unittest.TestCase):
+    def setUp(self):
+        self.text_trap = read_trap(
+            TRAPHANDLE_INPUT, RULES.missed_fields, RULES.oid_fields)
+        self.pdu_trap = pdu_trap(("10.10.1.12", 161), VARBINDS)
+
+    def test_same_varbinds_as_traphandle(self):
+        self.assertEqual(
+            [(oid, str(value)) for oid, _, value in self.pdu_trap.varbinds],
+            [(oid, value) for oid, _, value in self.text_trap.varbinds])
+        self.assertEqual(self.pdu_trap.address, self.text_trap.address)
+
+    def test_same_event(self):
+        event = self.pdu_trap.event()
+        transport, _, varbinds = event.partition("\n")
+        self.assertEqual(transport, "UDP: [10.10.1.12]:161")
+        self.assertEqual(varbinds, self.text_trap.event().partition("\n")[2])
+
+    def test_keeps_types(self):
+        self.assertEqual(
+            [value_type for _, value_type, _ in self.pdu_trap.varbinds],
+            ["STRING", "STRING", "OID", "INTEGER"])
+        self.assertEqual(self.pdu_trap.varbinds[-1][2], 40)
+
+    def test_text_in_traphandle_format(self):
+        self.assertEqual(self.pdu_trap.text.splitlines()[2:], [
+            "DISMAN-EVENT-MIB::sysUpTimeInstance 123456",
+            "SNMPv2-MIB::snmpTrapOID.0 iso.3.6.1.4.1.2.6.190.3",
+            "iso.3.6.1.4.1.2.6.190.4.1 \"# Machine Type = 4662F12\"",
+            "iso.3.6.1.4.1.2.6.190.4.4 \"# Error Code = 1627\"",
+            "iso.3.6.1.4.1.2.6.190.4.9 iso.3.6.1.4.1.99",
+            "iso.3.6.1.4.1.2.6.190.4.12 40",
+            "SNMP-COMMUNITY-MIB::snmpTrapAddress.0 10.10.1.12"
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
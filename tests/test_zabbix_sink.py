@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import struct
+import threading
+import unittest
+import socketserver
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.zabbix import ZabbixSink
+
+
+def read_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+
+class TrapperHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        header = read_exactly(self.request, 13)
+        if header[:5] != b"ZBXD\x01":
+            return
+        size, = struct.unpack("<Q", header[5:])
+        request = json.loads(read_exactly(self.request, size))
+        self.server.packets.append(request["data"])
+
+        failed = sum(
+            item["key"] in self.server.failing_keys for item in request["data"])
+        response = json.dumps({
+            "response": "success",
+            "info": f"processed: {len(request['data']) - failed}; "
+                    f"failed: {failed}; total: {len(request['data'])}; "
+                    f"seconds spent: 0.000100"
+        }).encode()
+        self.request.sendall(
+            b"ZBXD\x01" + struct.pack("<Q", len(response)) + response)
+
+
+# Local Zabbix trapper that speaks the ZBXD sender protocol, records every
+# packet and reports items with one of failing_keys as failed
+class FakeTrapper(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self, failing_keys=()):
+        super().__init__(("127.0.0.1", 0), TrapperHandler)
+        self.failing_keys = set(failing_keys)
+        self.packets = []
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ZabbixSinkTest(unittest.TestCase):
+    def test_one_packet_per_batch(self):
+        trapper = FakeTrapper()
+        self.addCleanup(trapper.close)
+        sink = ZabbixSink("127.0.0.1", trapper.port, 3, 60)
+        for number in range(7):
+            sink.add("storage", "snmptrap", f"event {number}")
+        self.assertEqual([len(packet) for packet in trapper.packets], [3, 3])
+        sink.flush()
+        self.assertEqual(
+            [len(packet) for packet in trapper.packets], [3, 3, 1])
+        self.assertEqual(
+            [item["value"] for packet in trapper.packets for item in packet],
+            [f"event {number}" for number in range(7)])
+        self.assertEqual(trapper.packets[0][0]["host"], "storage")
+        self.assertEqual(trapper.packets[0][0]["key"], "snmptrap")
+
+    def test_counts_from_info(self):
+        trapper = FakeTrapper(failing_keys={"unknown"})
+        self.addCleanup(trapper.close)
+        sink = ZabbixSink("127.0.0.1", trapper.port, 10, 60)
+        sink.add("storage", "snmptrap", "event")
+        sink.add("storage", "unknown", "event")
+        sink.add("storage", "snmptrap", "event")
+        response = sink.flush()
+        self.assertEqual(len(trapper.packets), 1)
+        self.assertEqual((response.processed, response.failed), (2, 1))
+        self.assertEqual((sink.processed, sink.failed), (2, 1))
+
+        sink.add("storage", "unknown", "event")
+        sink.flush()
+        self.assertEqual((sink.processed, sink.failed), (2, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,19 @@
 import os
+import sys
 import json
+import time
+import threading
 import requests
-import logging
-import logging.handlers
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.logs import get_logger
+from common.influx import LineWriter, DeadlineWriter
+from common.execd import triggers, parse_args, exit_now
+
 LOG_DIRECTORY = "/var/log/telegraf/scripts/"
 LOG_FILENAME = f"{os.path.basename(__file__)}_error.log"
 LOG_TIMEFORMAT = "%Y.%m.%d %H:%M:%S"
@@ -15,6 +23,23 @@ USER = "user"
 PASSWORD = "password"
 DOMAIN = "domain.local"
 
+# vCenters collected at the same time
+MAX_WORKERS = 8
+# (connect, read) seconds for each vROps API request
+HTTP_TIMEOUT = (10, 60)
+# Seconds to wait for all vCenters before reporting the late ones
+VC_TIMEOUT = 180
+
+# Acquired tokens are kept here between runs, readable by the owner only
+TOKEN_FILENAME = "/var/lib/telegraf/vrops_tokens.json"
+# Seconds before expiry after which a cached token is no longer used
+TOKEN_MARGIN = 300
+# Seconds a token is assumed valid when the response has no validity
+TOKEN_LIFETIME = 1800
+
+MEASUREMENT = "vrops"
+TAGS = ["url", "vcenter", "esxihost", "disk", "dsname", "cluster"]
+
 VC_HOSTS = [
     {
         "vc1.domain.local": "vc1-vrops.domain.local",
@@ -24,34 +49,115 @@ VC_HOSTS = [
 ]
 
 
-def logger(message):
-    log_handler = logging.handlers.RotatingFileHandler(
-        f"{LOG_DIRECTORY}/{LOG_FILENAME}",
-        maxBytes=LOG_MAXSIZE,
-        backupCount=5)
-    formatter = logging.Formatter(
-        "%(asctime)s %(message)s", LOG_TIMEFORMAT)
-    log_handler.setFormatter(formatter)
-    logger = logging.getLogger()
-    logger.addHandler(log_handler)
-    logger.error(message)
+LOGGER = get_logger(
+    f"{LOG_DIRECTORY}/{LOG_FILENAME}", LOG_MAXSIZE, timeformat=LOG_TIMEFORMAT)
+
+
+# Auth tokens by user and vROps address with their expiry time. Shared by
+# the collector threads; in execd mode it also stays in memory between
+# collections, otherwise it is loaded from and saved to TOKEN_FILENAME.
+class TokenCache:
+    def __init__(self):
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.reused = 0
+        self.acquired = 0
+        self.refreshed = 0
+        self.changed = False
+
+    def get(self, key):
+        with self.lock:
+            token, expires = self.tokens.get(key, (None, 0))
+            if token and time.time() < expires - TOKEN_MARGIN:
+                self.reused += 1
+                return token
+            return None
+
+    def put(self, key, token, expires):
+        with self.lock:
+            self.tokens[key] = (token, expires)
+            self.acquired += 1
+            self.changed = True
+
+    def drop(self, key):
+        with self.lock:
+            if self.tokens.pop(key, None):
+                self.refreshed += 1
+                self.changed = True
+
+    def get_stats_metric(self):
+        return {
+            "token_reused": self.reused,
+            "token_acquired": self.acquired,
+            "token_refreshed": self.refreshed
+        }
+
+    def load(self, filename):
+        try:
+            with open(filename) as file:
+                tokens = json.load(file)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            LOGGER.error(f"{filename}: {e}")
+            return
+        now = time.time()
+        with self.lock:
+            for key, (token, expires) in tokens.items():
+                if expires > now:
+                    self.tokens[key] = (token, expires)
+
+    def save(self, filename):
+        with self.lock:
+            if not self.changed:
+                return
+            now = time.time()
+            tokens = {
+                key: value for key, value in self.tokens.items()
+                if value[1] > now}
+            self.changed = False
+        try:
+            descriptor = os.open(
+                f"{filename}.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(tokens, file)
+            os.chmod(f"{filename}.tmp", 0o600)
+            os.replace(f"{filename}.tmp", filename)
+        except Exception as e:
+            LOGGER.error(f"{filename}: {e}")
+
 
 class Vrops:
-    def __init__(self, address, vc_name):
+    def __init__(self, address, vc_name, tokens=None):
         self.address = address
         self.vc_name = vc_name
-        self.header = {
+        self.tokens = tokens
+        self.credentials = None
+        # One keep-alive session per vROps endpoint for the life of the
+        # process, so auth, resources, relationships and stats queries share
+        # the TLS connection, across collections in execd mode
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.headers.update({
             "Accept": "application/json",
             "Content-Type": "application/json"
-        }
+        })
         self.status = 0
         self.tags = None
 
     def _request(self, suffix, query_method, query = None):
-        response = requests.request(
-            query_method, f"https://{self.address}/suite-api/" + suffix, verify=False,
-            headers=self.header, data=json.dumps(query))
-        response.close()
+        response = self.session.request(
+            query_method, f"https://{self.address}/suite-api/" + suffix,
+            data=json.dumps(query), timeout=HTTP_TIMEOUT)
+        # A cached token was revoked or expired early: acquire a new one and
+        # repeat the query once
+        if response.status_code == 401 and self.credentials:
+            if self.tokens:
+                self.tokens.drop(self._token_key())
+            self._acquire_token()
+            response = self.session.request(
+                query_method, f"https://{self.address}/suite-api/" + suffix,
+                data=json.dumps(query), timeout=HTTP_TIMEOUT)
         self.status = response.status_code
         return response.json()
 
@@ -116,15 +222,46 @@ class Vrops:
                             result[id].update({name: value})
         return result
 
+    def _token_key(self):
+        return f"{self.credentials['username']}@{self.address}"
+
+    def _set_token(self, token):
+        self.session.headers.update(
+            {"Authorization": f"vRealizeOpsToken {token}"})
+
+    def _acquire_token(self):
+        credentials, self.credentials = self.credentials, None
+        self.session.headers.pop("Authorization", None)
+        try:
+            response = self._request(
+                "api/auth/token/acquire", "POST", credentials)
+        finally:
+            self.credentials = credentials
+        self._set_token(response["token"])
+        if self.tokens:
+            # validity is the expiry time in epoch milliseconds, expiresAt
+            # the same time as text
+            validity = response.get("validity")
+            if validity:
+                expires = validity / 1000
+            else:
+                expires = time.time() + TOKEN_LIFETIME
+            self.tokens.put(self._token_key(), response["token"], expires)
+
     def auth(self, user, password, domain):
-        auth_query = {
+        self.credentials = {
             "username": user,
             "authSource": domain,
             "password": password
         }
-        token = self._request(
-            "api/auth/token/acquire", "POST", auth_query)["token"]
-        self.header.update({"Authorization": f"vRealizeOpsToken {token}"})
+        token = self.tokens and self.tokens.get(self._token_key())
+        if token:
+            self._set_token(token)
+        else:
+            self._acquire_token()
+
+    def close(self):
+        self.session.close()
 
     def get_metrics(self, resource_tag, metric_name, **resourcekind):
         resources = self._get_resources(list(resourcekind.values())[0])
@@ -170,30 +307,110 @@ class Vrops:
         self.tags = tags
 
 
-def main():
-    result = []
+def get_vropses(tokens):
+    vropses = []
     for vc in VC_HOSTS:
-        try:
-            for vc_name, address in vc.items():
-                vrops = Vrops(address, vc_name)
-                vrops.auth(USER, PASSWORD, DOMAIN)
-                status = vrops.get_service_metric()
-                result.append(status)
-                vrops.set_tags(
-                    dsname="Datastore",
-                    cluster="ClusterComputeResource",
-                )
-                metrics = vrops.get_metrics(
-                    "disk",
-                    "disk:naa|diskqueued",
-                    esxihost="HostSystem"
-                )
-                if metrics:
-                    result.extend(metrics)
-            print(json.dumps(result, indent=2))
-        except Exception as e:
-            logger(f"{vc_name}: {e}")
+        for vc_name, address in vc.items():
+            vropses.append(Vrops(address, vc_name, tokens))
+    return vropses
+
+
+# The service status is the one of the last API answer. A cached token
+# makes auth() send no request, so it is written after the metric queries
+# (or after the failed one)
+def collect(vrops, writer):
+    vrops.status = 0
+    try:
+        vrops.auth(USER, PASSWORD, DOMAIN)
+        vrops.set_tags(
+            dsname="Datastore",
+            cluster="ClusterComputeResource",
+        )
+        metrics = vrops.get_metrics(
+            "disk",
+            "disk:naa|diskqueued",
+            esxihost="HostSystem"
+        )
+        writer.write_all(metrics)
+    except Exception as e:
+        LOGGER.error(f"{vrops.vc_name}: {e}")
+    if vrops.status:
+        writer.write(vrops.get_service_metric())
+    writer.flush()
+
+
+# Every vCenter is collected in its own thread and written to the same
+# output, so a run takes as long as the slowest endpoint. A vCenter that is
+# not done after VC_TIMEOUT is reported, no longer waited for and the series
+# it produces later are dropped. running keeps the futures by vCenter across
+# cycles so a vCenter still busy with the previous cycle is not polled twice
+# at once
+def poll(executor, vropses, running, tokens, writer):
+    deadline = time.monotonic() + VC_TIMEOUT
+    collect_writer = DeadlineWriter(writer, deadline)
+    vc_names = []
+    for vrops in vropses:
+        future = running.get(vrops.vc_name)
+        if future and not future.done():
+            LOGGER.error(
+                f"{vrops.vc_name}: previous collection is still running")
+            continue
+        running[vrops.vc_name] = executor.submit(
+            collect, vrops, collect_writer)
+        vc_names.append(vrops.vc_name)
+    wait([running[vc_name] for vc_name in vc_names],
+         timeout=max(0, deadline - time.monotonic()))
+    for vc_name in vc_names:
+        if not running[vc_name].done():
+            LOGGER.error(f"{vc_name}: not finished after {VC_TIMEOUT} seconds")
+    tokens.save(TOKEN_FILENAME)
+    writer.write(tokens.get_stats_metric())
+    writer.flush()
+
+
+def close(vropses, running):
+    late = False
+    for vrops in vropses:
+        future = running.get(vrops.vc_name)
+        if future is None or future.done():
+            vrops.close()
+        else:
+            late = True
+    return late
+
+
+def main():
+    tokens = TokenCache()
+    tokens.load(TOKEN_FILENAME)
+    vropses = get_vropses(tokens)
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    running = {}
+    poll(executor, vropses, running, tokens, LineWriter(MEASUREMENT, TAGS))
+    executor.shutdown(wait=False, cancel_futures=True)
+    if close(vropses, running):
+        exit_now()
+
+
+# telegraf execd mode: the sessions and tokens stay in memory between
+# collections
+def execd(interval=None):
+    tokens = TokenCache()
+    tokens.load(TOKEN_FILENAME)
+    vropses = get_vropses(tokens)
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    writer = LineWriter(MEASUREMENT, TAGS)
+    running = {}
+    try:
+        for _ in triggers(interval):
+            poll(executor, vropses, running, tokens, writer)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        close(vropses, running)
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.execd:
+        execd(args.interval)
+    else:
+        main()